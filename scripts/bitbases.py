@@ -0,0 +1,205 @@
+from __future__ import annotations
+from array import array
+import os
+import time
+from game import Bitboard, Board, Game, Move, Piece, Square
+
+
+class Bitbases:
+    # win/draw tables of king and pawn, rook or queen against a lone king, one bit per position: set when the side
+    # with the piece (the strong side) wins. Generated by retrograde analysis with our own move generator.
+    # Positions are stored with white as the strong side, black strong positions are flipped vertically to look them up.
+    # KRK and KQK use the 8 symmetries of the board, the strong king is moved into the a1-a4-d4 triangle,
+    # KPK only the vertical mirror, the pawn is moved into the a-d files.
+    WIN = 1 # results of probe, for the side to move
+    DRAW = 0
+    LOSS = -1
+
+    DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+    FILES = {Game.PAWN: "kpk.bin", Game.ROOK: "krk.bin", Game.QUEEN: "kqk.bin"}
+
+    # squares of the a1-a4-d4 triangle (ranks 1 to 4, file not past the rank: a1, a2-b2 ... a4-d4), and the place of each one in the tables
+    TRIANGLE = [index for index in range(64) if (index & 7) <= 7 - (index >> 3) <= 3]
+    TRIANGLE_INDEX = {index: i for i, index in enumerate(TRIANGLE)}
+    # pawns on ranks 2 to 7 of the a-d files
+    PAWN_SQUARES = [index for index in range(8, 56) if index & 7 <= 3]
+    PAWN_INDEX = {index: i for i, index in enumerate(PAWN_SQUARES)}
+
+    _tables: dict[int, bytes] = {} # loaded on first probe
+
+    @staticmethod
+    def size(piece_type: int) -> int:
+        # positions in the table of piece_type, every one a bit
+        pieces = len(Bitbases.PAWN_SQUARES) if piece_type == Game.PAWN else len(Bitbases.TRIANGLE)
+        return pieces * 64 * 64 * 2
+
+    @staticmethod
+    def transpose(index: int) -> int:
+        # mirror along the a1-h8 diagonal, the file becomes the rank and the other way around
+        return (7 - (index >> 3)) | (7 - (index & 7)) << 3
+
+    @staticmethod
+    def index(piece_type: int, strong_king: int, weak_king: int, piece: int, strong_to_move: bool) -> int:
+        """
+        Place of a position in its table, white being the strong side.
+        :param piece_type: Engine type of the strong side piece, pawn, rook or queen.
+        :param strong_king: Square index of the strong side king.
+        :param weak_king: Square index of the lone king.
+        :param piece: Square index of the strong side piece.
+        :param strong_to_move: Whether the strong side is to move.
+        """
+        if piece_type == Game.PAWN:
+            if piece & 7 > 3:
+                strong_king, weak_king, piece = strong_king ^ 7, weak_king ^ 7, piece ^ 7
+            base, first, second = Bitbases.PAWN_INDEX[piece], strong_king, weak_king
+        else:
+            if strong_king & 7 > 3:
+                strong_king, weak_king, piece = strong_king ^ 7, weak_king ^ 7, piece ^ 7
+            if strong_king >> 3 < 4:
+                strong_king, weak_king, piece = strong_king ^ 56, weak_king ^ 56, piece ^ 56
+            if strong_king & 7 > 7 - (strong_king >> 3):
+                strong_king = Bitbases.transpose(strong_king)
+                weak_king = Bitbases.transpose(weak_king)
+                piece = Bitbases.transpose(piece)
+            base, first, second = Bitbases.TRIANGLE_INDEX[strong_king], weak_king, piece
+        return ((base * 64 + first) * 64 + second) * 2 + (0 if strong_to_move else 1)
+
+    @staticmethod
+    def load(piece_type: int) -> bytes:
+        table = Bitbases._tables.get(piece_type)
+        if table is None:
+            with open(os.path.join(Bitbases.DATA_DIRECTORY, Bitbases.FILES[piece_type]), 'rb') as file:
+                table = file.read()
+            Bitbases._tables[piece_type] = table
+        return table
+
+    @staticmethod
+    def probe(board: Board) -> int | None:
+        """
+        Result of a king and pawn, rook or queen against king position, with perfect play.
+        :param board: Position to look up.
+        :return: WIN, DRAW or LOSS for the side to move, None when the position isn't covered.
+        """
+        occupied = board.occupancy[0] | board.occupancy[1]
+        if occupied.bit_count() != 3: return None
+        piece = board.array[(occupied ^ board.bitboards[Game.WHITE | Game.KING] ^ board.bitboards[Game.BLACK | Game.KING]).bit_length() - 1]
+        if piece is None or piece.engine_type not in Bitbases.FILES: return None
+        strong = piece.color
+        strong_king = board.bitboards[strong | Game.KING].bit_length() - 1
+        weak_king = board.bitboards[(Game.WHITE - strong) | Game.KING].bit_length() - 1
+        piece_index = (board.bitboards[piece.engine_piece]).bit_length() - 1
+        if strong == Game.BLACK:
+            # seen from the other side of the board, so the pawn moves up like a white one
+            strong_king, weak_king, piece_index = strong_king ^ 56, weak_king ^ 56, piece_index ^ 56
+        strong_to_move = board.side_to_move == strong
+        index = Bitbases.index(piece.engine_type, strong_king, weak_king, piece_index, strong_to_move)
+        if not Bitbases.load(piece.engine_type)[index >> 3] >> (index & 7) & 1:
+            return Bitbases.DRAW
+        return Bitbases.WIN if strong_to_move else Bitbases.LOSS
+
+    @staticmethod
+    def generate(piece_type: int) -> bytearray:
+        """
+        Retrograde analysis of a table. Every legal position's moves are generated once, positions the strong side
+        wins are then found backwards from the mates: strong to move wins if some move wins, weak to move loses
+        if every move does.
+        Pawn tables need the rook and queen ones already generated, for promotions.
+        :param piece_type: Engine type of the strong side piece, pawn, rook or queen.
+        :return: Table packed as bits, position index i at bit i & 7 of byte i >> 3.
+        """
+        size = Bitbases.size(piece_type)
+        # a byte per position while solving, with two extra ones that successors point to when their result
+        # is already known: drawn (piece captured, minor promotion) or won (promotion into a won position)
+        won = bytearray(size + 2)
+        drawn_successor, won_successor = size, size + 1
+        won[won_successor] = 1
+        pending = {} # index -> successor indices, for positions not solved yet
+
+        board = Board('8/8/8/8/8/8/8/8 w - - 0 1')
+        strong_king_piece, weak_king_piece = Piece(Game.WHITE | Game.KING), Piece(Game.BLACK | Game.KING)
+        strong_piece = Piece(Game.WHITE | piece_type)
+        promotion_tables = {}
+        if piece_type == Game.PAWN:
+            promotion_tables = {Game.ROOK: Bitbases.load(Game.ROOK), Game.QUEEN: Bitbases.load(Game.QUEEN)}
+
+        for index in range(0, size, 2):
+            base, rest = divmod(index >> 1, 64 * 64)
+            first, second = divmod(rest, 64)
+            if piece_type == Game.PAWN:
+                piece, strong_king, weak_king = Bitbases.PAWN_SQUARES[base], first, second
+            else:
+                strong_king, weak_king, piece = Bitbases.TRIANGLE[base], first, second
+            if len({strong_king, weak_king, piece}) < 3 or Bitboard.KING_ATTACKS[strong_king] >> weak_king & 1:
+                continue # pieces on top of each other, or kings touching
+            board.put_piece(strong_king, strong_king_piece)
+            board.put_piece(weak_king, weak_king_piece)
+            board.put_piece(piece, strong_piece)
+            for side_index, color in ((index, Game.WHITE), (index + 1, Game.BLACK)):
+                board.side_to_move = color
+                enemy_king = board.bitboards[(Game.WHITE - color) | Game.KING].bit_length() - 1
+                if board.attackers_to(Square.all_squares()[enemy_king], color):
+                    continue # side not to move in check, can't happen
+                moves = board.generate_legal_move_codes()
+                if not moves:
+                    # only the lone king can be mated, stalemates are draws
+                    won[side_index] = 1 if color == Game.BLACK and board.in_check() else 0
+                    continue
+                successors = array('I')
+                for move in moves:
+                    start, end, kind = move & 63, move >> 6 & 63, move >> 12 & 7
+                    if move >> 12 & Move.CAPTURE:
+                        successors.append(drawn_successor)
+                    elif kind >= Move.PROMOTION:
+                        promoted = kind - Move.PROMOTION + Game.KNIGHT
+                        table = promotion_tables.get(promoted)
+                        promoted_index = Bitbases.index(promoted, strong_king, weak_king, end, False) if table else 0
+                        successors.append(won_successor if table and table[promoted_index >> 3] >> (promoted_index & 7) & 1
+                                          else drawn_successor)
+                    else:
+                        successors.append(Bitbases.index(piece_type,
+                                                         end if start == strong_king else strong_king,
+                                                         end if start == weak_king else weak_king,
+                                                         end if start == piece else piece,
+                                                         color == Game.BLACK))
+                if color == Game.BLACK and drawn_successor in successors:
+                    continue # lone king can reach a draw right away
+                pending[side_index] = successors
+            board.remove_piece(strong_king)
+            board.remove_piece(weak_king)
+            board.remove_piece(piece)
+
+        # every pass solves the positions one ply further from the known results
+        solved = True
+        while solved:
+            solved = False
+            for index, successors in list(pending.items()):
+                if index & 1 == 0:
+                    result = any(won[successor] for successor in successors)
+                else:
+                    result = all(won[successor] for successor in successors)
+                if result:
+                    won[index] = 1
+                    del pending[index]
+                    solved = True
+            # whatever is left can't be won
+
+        table = bytearray(size >> 3)
+        for index in range(size):
+            if won[index]:
+                table[index >> 3] |= 1 << (index & 7)
+        return table
+
+    @staticmethod
+    def generate_all() -> None:
+        # rook and queen first, pawn promotions are looked up in them
+        for piece_type in (Game.ROOK, Game.QUEEN, Game.PAWN):
+            start = time.perf_counter()
+            table = Bitbases.generate(piece_type)
+            with open(os.path.join(Bitbases.DATA_DIRECTORY, Bitbases.FILES[piece_type]), 'wb') as file:
+                file.write(table)
+            Bitbases._tables[piece_type] = bytes(table)
+            print(f"{Bitbases.FILES[piece_type]}: {len(table)} bytes, {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    Bitbases.generate_all()
@@ -0,0 +1,114 @@
+from __future__ import annotations
+import argparse
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import json
+import sys
+import time
+import stockfish
+from game import PARALLEL_CONTEXT, Board, _init_perft_worker, _perft_task
+
+
+class BisectionReport:
+    def __init__(self, root_fen: str, root_depth: int):
+        self.root_fen = root_fen
+        self.root_depth = root_depth
+        self.found = False # False when every count matched the reference
+        self.fen = root_fen # minimal failing position, where the move lists differ
+        self.path = [] # engine moves from the root to fen
+        self.missing = [] # moves the reference plays in fen and we don't
+        self.extra = [] # moves we play in fen and the reference doesn't
+        self.mismatches = [] # divide counts that differed on the way down, (path, move, expected, actual)
+        self.positions = 0 # positions compared
+        self.elapsed = 0.0
+
+    def to_dict(self) -> dict:
+        return {'found': self.found, 'root_fen': self.root_fen, 'root_depth': self.root_depth,
+                'fen': self.fen, 'path': self.path, 'missing': self.missing, 'extra': self.extra,
+                'mismatches': [{'path': path, 'move': move, 'expected': expected, 'actual': actual}
+                               for path, move, expected, actual in self.mismatches],
+                'positions': self.positions, 'seconds': round(self.elapsed, 4)}
+
+
+class DivideBisect:
+    # finds the position where our move generator and the reference engine disagree, starting from a perft that fails.
+    # Every level compares the divides of a set of positions, the root moves whose counts differ are expanded one
+    # ply deeper, until a position's move lists differ. Reference divides are asked from the stockfish pool by a
+    # thread pool (and come from its cache when already known), our divides are a task per root move in a process pool.
+
+    @staticmethod
+    def run(fen: str, depth: int, workers: int | None = None, reference_threads: int = 2, max_branches: int = 4,
+            cache_mb: float = 0, use_cache: bool = True) -> BisectionReport:
+        """
+        Bisects a perft down to a position with a wrong move list.
+        :param fen: Root position.
+        :param depth: Perft depth the counts differ at.
+        :param workers: Processes for our perft, defaults to the cpu count.
+        :param reference_threads: Reference engine queries at the same time, also the stockfish pool size.
+        :param max_branches: Differing subtrees expanded at every level, the smallest ones first.
+        :param cache_mb: Size of the PerftCache kept by each worker, 0 for none.
+        :param use_cache: Take reference divides from the oracle cache.
+        :return: Report with the first minimal failing position found.
+        """
+        start = time.perf_counter()
+        report = BisectionReport(fen, depth)
+        # workers don't fork this process, the reference threads could be holding locks a fork would copy
+        stockfish.get_pool(reference_threads) # size only counts if it is the first use of the pool
+        frontier = [(fen, [], depth)]
+        with ThreadPoolExecutor(max_workers=reference_threads) as threads, \
+                ProcessPoolExecutor(max_workers=workers, mp_context=PARALLEL_CONTEXT, initializer=_init_perft_worker,
+                                    initargs=(cache_mb,)) as pool:
+            while frontier and not report.found:
+                # every position of the level at once, reference and local
+                references = [threads.submit(stockfish.perft, node_fen, node_depth, use_cache)
+                              for node_fen, _, node_depth in frontier]
+                locals_ = [DivideBisect.submit_divide(pool, node_fen, node_depth) for node_fen, _, node_depth in frontier]
+                next_frontier = []
+                for (node_fen, path, node_depth), reference, local in zip(frontier, references, locals_):
+                    expected = reference.result()
+                    actual = {move: future.result() for move, future in local.items()}
+                    report.positions += 1
+                    missing = sorted(set(expected) - set(actual))
+                    extra = sorted(set(actual) - set(expected))
+                    if missing or extra:
+                        report.found = True
+                        report.fen, report.path, report.missing, report.extra = node_fen, path, missing, extra
+                        break
+                    differing = [move for move in expected if expected[move] != actual[move]]
+                    for move in differing:
+                        report.mismatches.append((path, move, expected[move], actual[move]))
+                        next_frontier.append((expected[move], Board(node_fen).branch_move(move).fen, path + [move], node_depth - 1))
+                # cheapest subtrees first, a single wrong move list is enough
+                next_frontier.sort(key=lambda node: node[0])
+                frontier = [node[1:] for node in next_frontier[:max_branches]]
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    @staticmethod
+    def submit_divide(pool: ProcessPoolExecutor, fen: str, depth: int) -> dict:
+        # our divide of a position as futures, one perft task per legal move
+        moves = [m.engine_move for m in Board(fen).generate_legal_moves()]
+        if depth == 1:
+            # leaves, no need for the pool
+            leaves = {move: Future() for move in moves}
+            for future in leaves.values():
+                future.set_result(1)
+            return leaves
+        return {move: pool.submit(_perft_task, fen, [move], depth - 1) for move in moves}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bisects a failing perft against the reference engine, prints a JSON report.")
+    parser.add_argument('fen', help="root position")
+    parser.add_argument('depth', type=int, help="perft depth the counts differ at")
+    parser.add_argument('--workers', type=int, default=None, help="processes for our perft, defaults to the cpu count")
+    parser.add_argument('--reference-threads', type=int, default=2, help="reference engine queries at the same time")
+    parser.add_argument('--max-branches', type=int, default=4, help="differing subtrees expanded every level")
+    parser.add_argument('--cache-mb', type=float, default=0, help="perft cache per worker, 0 for none")
+    parser.add_argument('--no-cache', action='store_true', help="always ask the reference engine")
+    args = parser.parse_args()
+
+    report = DivideBisect.run(args.fen, args.depth, args.workers, args.reference_threads, args.max_branches,
+                              args.cache_mb, not args.no_cache)
+    json.dump(report.to_dict(), sys.stdout, indent=2)
+    print()
+    sys.exit(1 if report.found else 0)
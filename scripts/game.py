@@ -1,6 +1,9 @@
 from __future__ import annotations
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
 from operator import countOf
-import time
+import random
 
 class Game:
     WHITE = 0b1000
@@ -25,30 +28,50 @@ class Game:
 class Square:
     FILES = " abcdefgh" # extra space at the start for making both file and rank start at one
 
+    # there's only one instance per square, Square('e4') and Square.from_name('e4') return the same object
+    __slots__ = ('index', 'file', 'rank', '_name', '_file_char')
+
     _ALL_SQUARES_LIST = None
     _ALL_SQUARES_DICT = None
 
-    def __init__(self, pos: str):
-        self.file = Square.FILES.index(pos[0]) # assign file a number instead of letter
-        self.rank = int(pos[1])
-        self._name = pos
+    def __new__(cls, pos: str):
+        return Square.from_name(pos)
+
+    @staticmethod
+    def _create(pos: str) -> Square:
+        square = object.__new__(Square)
+        square.file = Square.FILES.index(pos[0]) # assign file a number instead of letter
+        square.rank = int(pos[1])
+        square._name = pos
         # cache index and file char
-        self._index = self.file-1 + (8-self.rank)*8
-        self._file_char = Square.FILES[self.file]
+        square.index = square.file-1 + (8-square.rank)*8
+        square._file_char = Square.FILES[square.file]
+        return square
 
     def get(self) -> str:
         return self._name
 
     def get_offset(self, offset: tuple[int, int]) -> Square:
-        if not (1 <= self.file+offset[0] <= 8 and 1 <= self.rank+offset[1] <= 8): return None # outside bounds
-        return self.from_name(Square.FILES[self.file+offset[0]]+str(self.rank+offset[1]))
+        file = self.file+offset[0]
+        rank = self.rank+offset[1]
+        if not (1 <= file <= 8 and 1 <= rank <= 8): return None # outside bounds
+        return Square._ALL_SQUARES_LIST[file-1 + (8-rank)*8]
 
     def to_1dimensional_index(self) -> int:
-        return self._index
+        return self.index
 
     def get_file(self) -> str:
         return self._file_char
 
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Square) and other.index == self.index
+
+    def __hash__(self) -> int:
+        return self.index
+
+    def __repr__(self) -> str:
+        return f"Square({self._name!r})"
+
     @staticmethod
     def all_squares() -> list[Square]:
         if Square._ALL_SQUARES_LIST is None:
@@ -58,22 +81,28 @@ class Square:
             # we must start at a8 and finisgh in h1
             files = "abcdefgh"
             ranks = list(range(8,0,-1))
-            squares = []
             for r in ranks:
                 for f in files:
-                    s = Square(f + str(r))
+                    s = Square._create(f + str(r))
                     Square._ALL_SQUARES_LIST.append(s)
                     Square._ALL_SQUARES_DICT[f + str(r)] = s
         return Square._ALL_SQUARES_LIST
 
     @staticmethod
-    def from_name(name: str) -> "Square":
-        if Square._ALL_SQUARES_DICT is None:
-            Square.all_squares()
+    def from_name(name: str) -> Square:
         return Square._ALL_SQUARES_DICT[name]
 
+    @staticmethod
+    def from_index(index: int) -> Square:
+        return Square._ALL_SQUARES_LIST[index]
+
+Square.all_squares()
+
 
 class Piece:
+    # only 12 pieces exist, Piece(...) always hands back the same shared instance for each of them
+    __slots__ = ('fen_piece', 'engine_piece', 'color', 'engine_type')
+
     # Precompute once
     _FEN_TO_ENGINE = {'p': Game.BLACK | Game.PAWN, 'n': Game.BLACK | Game.KNIGHT, 'b': Game.BLACK | Game.BISHOP,
         'r': Game.BLACK | Game.ROOK, 'q': Game.BLACK | Game.QUEEN, 'k': Game.BLACK | Game.KING,
@@ -82,15 +111,29 @@ class Piece:
 
     _ENGINE_TO_FEN = {v: k for k, v in _FEN_TO_ENGINE.items()}
 
-    def __init__(self, piece: str | int):
-        if type(piece) is str:
-            self.fen_piece = piece
-            self.engine_piece = self.fen_piece_to_engine_piece(piece)
-        else:
-            self.engine_piece = piece
-            self.fen_piece = self.engine_piece_to_fen_piece(piece)
-        self.color = Game.WHITE if format(self.engine_piece, '04b')[0] == '1' else Game.BLACK
-        self.engine_type = int(format(self.engine_piece, '04b')[1:], 2)
+    _INSTANCES = {} # keyed by both engine piece and fen piece, filled once below the class
+
+    def __new__(cls, piece: str | int):
+        return Piece._INSTANCES[piece]
+
+    @staticmethod
+    def _create(engine_piece: int) -> Piece:
+        piece = object.__new__(Piece)
+        piece.engine_piece = engine_piece
+        piece.fen_piece = Piece._ENGINE_TO_FEN[engine_piece]
+        piece.color = engine_piece & 0b1000
+        piece.engine_type = engine_piece & 0b111
+        return piece
+
+    @staticmethod
+    def intern_all() -> None:
+        for engine_piece in Piece._ENGINE_TO_FEN:
+            piece = Piece._create(engine_piece)
+            Piece._INSTANCES[engine_piece] = piece
+            Piece._INSTANCES[piece.fen_piece] = piece
+
+    def __repr__(self) -> str:
+        return f"Piece({self.fen_piece!r})"
 
     @staticmethod
     def fen_piece_to_engine_piece(piece: str) -> int:
@@ -102,25 +145,339 @@ class Piece:
         if piece == " ": return None
         return Piece._ENGINE_TO_FEN[piece]
 
+Piece.intern_all()
+
+class Bitboard:
+    # bit n of a bitboard represents Board.array[n], so a8 is the lowest bit and h1 the highest,
+    # going north (up a rank) is a right shift by 8 and going east (up a file) is a left shift by 1
+    FULL = (1 << 64) - 1
+    FILE_A = 0x0101010101010101
+    FILE_H = FILE_A << 7
+    NOT_FILE_A = FULL ^ FILE_A
+    NOT_FILE_H = FULL ^ FILE_H
+    RANK_8 = 0xFF
+    RANK_1 = RANK_8 << 56
+
+    # directions, in the same order as SHIFTS, and how much a square index changes on each step
+    NORTH, SOUTH, EAST, WEST, NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST = range(8)
+    DIRECTION_STEPS = (-8, 8, 1, -1, -7, -9, 9, 7)
+    BISHOP_DIRECTIONS = (NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST)
+    ROOK_DIRECTIONS = (NORTH, SOUTH, EAST, WEST)
+    QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+    SHIFTS = None
+
+    # precomputed per square tables, see generate_tables
+    KNIGHT_ATTACKS = None
+    KING_ATTACKS = None
+    PAWN_ATTACKS = None # indexed by color >> 3 first
+    PAWN_PUSHES = None # indexed by color >> 3 first
+    PAWN_DOUBLE_PUSHES = None # indexed by color >> 3 first
+    RAYS = None # indexed by direction first, square indices going outwards from the origin
+    RAY_MASKS = None # indexed by direction first, same squares as RAYS
+    RAY_TO = None # indexed by origin then target, squares walked from the origin (excluded) to the target (included)
+
+    @staticmethod
+    def north(bb: int) -> int:
+        return bb >> 8
+
+    @staticmethod
+    def south(bb: int) -> int:
+        return (bb << 8) & Bitboard.FULL
+
+    @staticmethod
+    def east(bb: int) -> int:
+        return (bb << 1) & Bitboard.NOT_FILE_A # bits wrapping from the h file into the a file get removed
+
+    @staticmethod
+    def west(bb: int) -> int:
+        return (bb >> 1) & Bitboard.NOT_FILE_H
+
+    @staticmethod
+    def north_east(bb: int) -> int:
+        return (bb >> 7) & Bitboard.NOT_FILE_A
+
+    @staticmethod
+    def north_west(bb: int) -> int:
+        return (bb >> 9) & Bitboard.NOT_FILE_H
+
+    @staticmethod
+    def south_east(bb: int) -> int:
+        return (bb << 9) & Bitboard.NOT_FILE_A
+
+    @staticmethod
+    def south_west(bb: int) -> int:
+        return (bb << 7) & Bitboard.NOT_FILE_H
+
+    @staticmethod
+    def knight_attacks(bb: int) -> int:
+        n, s, e, w = Bitboard.north, Bitboard.south, Bitboard.east, Bitboard.west
+        return (n(n(e(bb))) | n(n(w(bb))) | s(s(e(bb))) | s(s(w(bb)))
+                | e(e(n(bb))) | e(e(s(bb))) | w(w(n(bb))) | w(w(s(bb))))
+
+    @staticmethod
+    def king_attacks(bb: int) -> int:
+        attacks = bb | Bitboard.east(bb) | Bitboard.west(bb)
+        attacks |= Bitboard.north(attacks) | Bitboard.south(attacks)
+        return attacks ^ bb
+
+    @staticmethod
+    def pawn_attacks(bb: int, color: int) -> int:
+        if color == Game.WHITE:
+            return Bitboard.north_east(bb) | Bitboard.north_west(bb)
+        return Bitboard.south_east(bb) | Bitboard.south_west(bb)
+
+    @staticmethod
+    def ray_attacks(index: int, occupied: int, directions) -> int:
+        # attacks of a single slider from the ray tables, the ray is cut behind its first blocker by removing the blocker's own ray
+        attacks = 0
+        for direction in directions:
+            ray = Bitboard.RAY_MASKS[direction][index]
+            blockers = ray & occupied
+            if blockers:
+                ray ^= Bitboard.RAY_MASKS[direction][Bitboard.closest(blockers, direction)]
+            attacks |= ray
+        return attacks
+
+    @staticmethod
+    def closest(bb: int, direction: int) -> int:
+        # index of the first set bit met when walking in direction
+        if Bitboard.DIRECTION_STEPS[direction] > 0:
+            return (bb & -bb).bit_length() - 1 # lowest bit
+        return bb.bit_length() - 1 # highest bit
+
+    @staticmethod
+    def bishop_attacks(index: int, occupied: int) -> int:
+        return Bitboard.ray_attacks(index, occupied, Bitboard.BISHOP_DIRECTIONS)
+
+    @staticmethod
+    def rook_attacks(index: int, occupied: int) -> int:
+        return Bitboard.ray_attacks(index, occupied, Bitboard.ROOK_DIRECTIONS)
+
+    @staticmethod
+    def queen_attacks(index: int, occupied: int) -> int:
+        return Bitboard.ray_attacks(index, occupied, Bitboard.QUEEN_DIRECTIONS)
+
+    @staticmethod
+    def indices(bb: int):
+        # yields the index of every set bit, from lowest to highest
+        while bb:
+            lsb = bb & -bb
+            yield lsb.bit_length() - 1
+            bb ^= lsb
+
+    @staticmethod
+    def generate_tables() -> None:
+        # per square lookups, built once on import from the set-wise functions
+        Bitboard.KNIGHT_ATTACKS = [Bitboard.knight_attacks(1 << index) for index in range(64)]
+        Bitboard.KING_ATTACKS = [Bitboard.king_attacks(1 << index) for index in range(64)]
+        Bitboard.PAWN_ATTACKS = [[Bitboard.pawn_attacks(1 << index, color) for index in range(64)] for color in (Game.BLACK, Game.WHITE)]
+        Bitboard.PAWN_PUSHES = [[Bitboard.south(1 << index) for index in range(64)], [Bitboard.north(1 << index) for index in range(64)]]
+        # only pawns on their starting rank have a double push
+        Bitboard.PAWN_DOUBLE_PUSHES = [[(1 << index+16) if 8 <= index < 16 else 0 for index in range(64)],
+                                       [(1 << index-16) if 48 <= index < 56 else 0 for index in range(64)]]
+        Bitboard.RAYS = []
+        Bitboard.RAY_MASKS = []
+        for shift in Bitboard.SHIFTS:
+            rays = []
+            masks = []
+            for index in range(64):
+                ray = []
+                bb = shift(1 << index)
+                while bb:
+                    ray.append(bb.bit_length() - 1)
+                    bb = shift(bb)
+                rays.append(ray)
+                masks.append(sum(1 << target for target in ray))
+            Bitboard.RAYS.append(rays)
+            Bitboard.RAY_MASKS.append(masks)
+        # squares not sharing a line only get the target itself, which is what check evasion needs for knights
+        Bitboard.RAY_TO = [[1 << target for target in range(64)] for _ in range(64)]
+        for direction in range(8):
+            for origin in range(64):
+                for target in Bitboard.RAYS[direction][origin]:
+                    Bitboard.RAY_TO[origin][target] = Bitboard.RAY_MASKS[direction][origin] ^ Bitboard.RAY_MASKS[direction][target]
+
+Bitboard.SHIFTS = (Bitboard.north, Bitboard.south, Bitboard.east, Bitboard.west,
+                   Bitboard.north_east, Bitboard.north_west, Bitboard.south_east, Bitboard.south_west)
+Bitboard.generate_tables()
+
+class Zobrist:
+    # fixed seed so every run, and every process, hashes the same position to the same key
+    SEED = 0x5EED
+
+    PIECES = None # indexed by engine piece, then by square index
+    CASTLING = None # indexed by castling right char
+    EN_PASSANT = None # indexed by file, starting at 0
+    WHITE_TO_MOVE = None
+
+    @staticmethod
+    def generate_keys() -> None:
+        rng = random.Random(Zobrist.SEED)
+        Zobrist.PIECES = [[rng.getrandbits(64) for _ in range(64)] for _ in range(14)]
+        Zobrist.CASTLING = {right: rng.getrandbits(64) for right in 'KQkq'}
+        Zobrist.EN_PASSANT = [rng.getrandbits(64) for _ in range(8)]
+        Zobrist.WHITE_TO_MOVE = rng.getrandbits(64)
+
+    @staticmethod
+    def castling_key(castling_capabilities: str) -> int:
+        key = 0
+        for right in castling_capabilities:
+            key ^= Zobrist.CASTLING.get(right, 0) # '-' has no key
+        return key
+
+    @staticmethod
+    def en_passant_key(en_passant_square: Square | None) -> int:
+        if en_passant_square is None: return 0
+        return Zobrist.EN_PASSANT[en_passant_square.index % 8]
+
+Zobrist.generate_keys()
+
+class Evaluation:
+    # tapered evaluation: material plus piece-square tables, scored once for the midgame and once for the endgame,
+    # then blended by the game phase (how much non pawn material is left on the board)
+    MG_VALUES = [82, 337, 365, 477, 1025, 0] # indexed by engine type
+    EG_VALUES = [94, 281, 297, 512, 936, 0]
+    PHASE_WEIGHTS = [0, 1, 1, 2, 4, 0]
+    MAX_PHASE = 24 # starting position, 4 minors + 4 rooks * 2 + 2 queens * 4
+
+    # piece-square tables laid out like Board.array from white's point of view, first row is the 8th rank
+    PAWN_MG = [
+          0,   0,   0,   0,   0,   0,   0,   0,
+         50,  50,  50,  50,  50,  50,  50,  50,
+         10,  10,  20,  30,  30,  20,  10,  10,
+          5,   5,  10,  25,  25,  10,   5,   5,
+          0,   0,   0,  20,  20,   0,   0,   0,
+          5,  -5, -10,   0,   0, -10,  -5,   5,
+          5,  10,  10, -20, -20,  10,  10,   5,
+          0,   0,   0,   0,   0,   0,   0,   0]
+    PAWN_EG = [
+          0,   0,   0,   0,   0,   0,   0,   0,
+         80,  80,  80,  80,  80,  80,  80,  80,
+         50,  50,  50,  50,  50,  50,  50,  50,
+         30,  30,  30,  30,  30,  30,  30,  30,
+         15,  15,  15,  15,  15,  15,  15,  15,
+          5,   5,   5,   5,   5,   5,   5,   5,
+          0,   0,   0,   0,   0,   0,   0,   0,
+          0,   0,   0,   0,   0,   0,   0,   0]
+    KNIGHT = [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20,   0,   0,   0,   0, -20, -40,
+        -30,   0,  10,  15,  15,  10,   0, -30,
+        -30,   5,  15,  20,  20,  15,   5, -30,
+        -30,   0,  15,  20,  20,  15,   0, -30,
+        -30,   5,  10,  15,  15,  10,   5, -30,
+        -40, -20,   0,   5,   5,   0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50]
+    BISHOP = [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,  10,  10,   5,   0, -10,
+        -10,   5,   5,  10,  10,   5,   5, -10,
+        -10,   0,  10,  10,  10,  10,   0, -10,
+        -10,  10,  10,  10,  10,  10,  10, -10,
+        -10,   5,   0,   0,   0,   0,   5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20]
+    ROOK = [
+          0,   0,   0,   0,   0,   0,   0,   0,
+          5,  10,  10,  10,  10,  10,  10,   5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+          0,   0,   0,   5,   5,   0,   0,   0]
+    QUEEN = [
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,   5,   5,   5,   0, -10,
+         -5,   0,   5,   5,   5,   5,   0,  -5,
+          0,   0,   5,   5,   5,   5,   0,  -5,
+        -10,   5,   5,   5,   5,   5,   0, -10,
+        -10,   0,   5,   0,   0,   0,   0, -10,
+        -20, -10, -10,  -5,  -5, -10, -10, -20]
+    KING_MG = [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+         20,  20,   0,   0,   0,   0,  20,  20,
+         20,  30,  10,   0,   0,  10,  30,  20]
+    KING_EG = [
+        -50, -40, -30, -20, -20, -30, -40, -50,
+        -30, -20, -10,   0,   0, -10, -20, -30,
+        -30, -10,  20,  30,  30,  20, -10, -30,
+        -30, -10,  30,  40,  40,  30, -10, -30,
+        -30, -10,  30,  40,  40,  30, -10, -30,
+        -30, -10,  20,  30,  30,  20, -10, -30,
+        -30, -30,   0,   0,   0,   0, -30, -30,
+        -50, -30, -30, -30, -30, -30, -30, -50]
+
+    # material and square combined, indexed by engine piece then square index, black entries mirrored and negated
+    # so a position's score is the plain sum over its pieces, from white's point of view
+    MG_TABLES = None
+    EG_TABLES = None
+
+    @staticmethod
+    def generate_tables() -> None:
+        mg = [Evaluation.PAWN_MG, Evaluation.KNIGHT, Evaluation.BISHOP, Evaluation.ROOK, Evaluation.QUEEN, Evaluation.KING_MG]
+        eg = [Evaluation.PAWN_EG, Evaluation.KNIGHT, Evaluation.BISHOP, Evaluation.ROOK, Evaluation.QUEEN, Evaluation.KING_EG]
+        Evaluation.MG_TABLES = [[0] * 64 for _ in range(14)]
+        Evaluation.EG_TABLES = [[0] * 64 for _ in range(14)]
+        for piece_type in range(6):
+            for index in range(64):
+                # index ^ 56 flips the rank, which is the same square seen from black's side
+                Evaluation.MG_TABLES[Game.WHITE | piece_type][index] = Evaluation.MG_VALUES[piece_type] + mg[piece_type][index]
+                Evaluation.EG_TABLES[Game.WHITE | piece_type][index] = Evaluation.EG_VALUES[piece_type] + eg[piece_type][index]
+                Evaluation.MG_TABLES[Game.BLACK | piece_type][index] = -(Evaluation.MG_VALUES[piece_type] + mg[piece_type][index ^ 56])
+                Evaluation.EG_TABLES[Game.BLACK | piece_type][index] = -(Evaluation.EG_VALUES[piece_type] + eg[piece_type][index ^ 56])
+
+Evaluation.generate_tables()
+
 class Board:
+    # move generation stages, see generate_legal_move_codes
+    ALL_MOVES = 0
+    TACTICAL_MOVES = 1
+    QUIET_MOVES = 2
+
+    # castling right lost when a piece leaves or arrives at these squares (rook moved or captured)
+    _CASTLING_ROOK_SQUARES = {63: 'K', 56: 'Q', 7: 'k', 0: 'q'}
+
     def __init__(self, fen=None):
-        if fen:
-            self.fen = fen
-        else:
-            self.fen = self.get_starting_fen()
-        self.array = self.get_array()
-        dissected = self.fen.split()
+        if not fen:
+            fen = self.get_starting_fen()
+        self.array = self.get_array(fen)
+        # one bitboard per engine piece (indexed by Piece.engine_piece) and one occupancy mask per color (indexed by color >> 3),
+        # kept alongside self.array so square lookups stay O(1) while set-wise queries work on masks
+        self.bitboards, self.occupancy = self.get_bitboards()
+        dissected = fen.split()
         self.side_to_move = Game.WHITE if dissected[1] == 'w' else Game.BLACK
         self.castling_capabilities = dissected[2]
-        self.en_passant_squares = None if dissected[3] == '-' else Square(dissected[3])
+        self.en_passant_squares = None if dissected[3] == '-' else Square.from_name(dissected[3])
         self.hm_since_irreversible = None if dissected[4]== '-' else int(dissected[4])
         self.full_moves = None if dissected[5] == '-' else int(dissected[5])
+        # 64-bit zobrist key of the position, updated incrementally by make_move
+        self.hash = self.compute_hash()
+        # evaluation terms from white's point of view, updated incrementally like the hash
+        self.mg_score, self.eg_score, self.phase = self.compute_evaluation()
+        # one entry per make_move, holding everything unmake_move can't deduce from the move itself
+        self.undo_stack = []
+
+    @property
+    def fen(self) -> str:
+        return " ".join([Board.array_to_fen(self.array),
+                         'w' if self.side_to_move == Game.WHITE else 'b',
+                         self.castling_capabilities,
+                         self.en_passant_squares.get() if self.en_passant_squares else '-',
+                         '-' if self.hm_since_irreversible is None else str(self.hm_since_irreversible),
+                         '-' if self.full_moves is None else str(self.full_moves)])
 
     def get_starting_fen(self) -> str:
         return "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
 
-    def get_array(self) -> list[Piece | None]:
-        board = self.fen.split()[0]
+    def get_array(self, fen: str) -> list[Piece | None]:
+        board = fen.split()[0]
         build = []
         for char in board:
             if char == '/':
@@ -132,8 +489,52 @@ class Board:
                 build.append(Piece(char))
         return build
 
+    def get_bitboards(self) -> tuple[list[int], list[int]]:
+        bitboards = [0] * 14 # engine pieces go from 0b0000 (black pawn) to 0b1101 (white king)
+        for index, piece in enumerate(self.array):
+            if piece:
+                bitboards[piece.engine_piece] |= 1 << index
+        occupancy = [0, 0]
+        for engine_piece, bb in enumerate(bitboards):
+            occupancy[engine_piece >> 3] |= bb
+        return bitboards, occupancy
+
+    def compute_evaluation(self) -> tuple[int, int, int]:
+        # from scratch midgame score, endgame score and phase, used on creation and to validate the incremental ones
+        mg_score = eg_score = phase = 0
+        for engine_piece, bb in enumerate(self.bitboards):
+            for index in Bitboard.indices(bb):
+                mg_score += Evaluation.MG_TABLES[engine_piece][index]
+                eg_score += Evaluation.EG_TABLES[engine_piece][index]
+                phase += Evaluation.PHASE_WEIGHTS[engine_piece & 0b111]
+        return mg_score, eg_score, phase
+
+    def evaluate(self) -> int:
+        # O(1), blends the incremental scores by phase, from the side to move point of view
+        phase = min(self.phase, Evaluation.MAX_PHASE) # promotions can push it past the starting material
+        score = (self.mg_score * phase + self.eg_score * (Evaluation.MAX_PHASE - phase)) // Evaluation.MAX_PHASE
+        return score if self.side_to_move == Game.WHITE else -score
+
+    def compute_hash(self) -> int:
+        # from scratch zobrist key, used on creation and to validate the incremental one
+        key = 0
+        for engine_piece, bb in enumerate(self.bitboards):
+            for index in Bitboard.indices(bb):
+                key ^= Zobrist.PIECES[engine_piece][index]
+        key ^= Zobrist.castling_key(self.castling_capabilities)
+        key ^= Zobrist.en_passant_key(self.en_passant_squares)
+        if self.side_to_move == Game.WHITE:
+            key ^= Zobrist.WHITE_TO_MOVE
+        return key
+
+    def get_occupied(self) -> int:
+        return self.occupancy[0] | self.occupancy[1]
+
+    def color_mask(self, color: int) -> int:
+        return self.occupancy[color >> 3]
+
     def get_square(self, square: Square) ->  Piece | None:
-        return self.array[square.to_1dimensional_index()]
+        return self.array[square.index]
 
     def get_file(self, file: str | int) -> list[Piece | None]:
         if type(file) is str:
@@ -149,154 +550,284 @@ class Board:
         rank = 8-rank # 8th rank in chess is the top rank, counting from top to bottom means its the first rank
         return self.array[rank*8:rank*8+8]
 
+    def attackers_to(self, square: Square, color: int, occupied: int | None = None) -> int:
+        # mask of the pieces of color attacking square, found by looking outwards from the square with every piece's
+        # attack pattern and intersecting with the bitboard of that piece
+        # occupied can be overridden to see through pieces about to move
+        index = square.index
+        pieces = self.bitboards
+        queens = pieces[color | Game.QUEEN]
+        if occupied is None:
+            occupied = self.occupancy[0] | self.occupancy[1]
+        # a pawn attacks the square if a pawn of the opposite color standing there would attack the pawn back
+        attackers = Bitboard.PAWN_ATTACKS[(Game.WHITE-color) >> 3][index] & pieces[color | Game.PAWN]
+        attackers |= Bitboard.KNIGHT_ATTACKS[index] & pieces[color | Game.KNIGHT]
+        attackers |= Bitboard.KING_ATTACKS[index] & pieces[color | Game.KING]
+        attackers |= Bitboard.bishop_attacks(index, occupied) & (pieces[color | Game.BISHOP] | queens)
+        attackers |= Bitboard.rook_attacks(index, occupied) & (pieces[color | Game.ROOK] | queens)
+        return attackers
+
     def is_square_being_attacked_by_color(self, square: Square, color: int) -> bool:
-        # loop all squares
-        squares = Square.all_squares()
-        for current_square in squares:
-            # for each square in board
-            if self.get_square(current_square):
-                if self.get_square(current_square).color == color:
-                    # target square has a piece of the correct color to check
-                    for move in PieceMoves.generate_moves(self, current_square, True):
-                        # for each possible move with that piece, if that move target end square matches, color controls square
-                        # skipping pawn advances, as they do not control those squares
-                        if move.end_square.get() == square.get() and not move.is_not_controlling: return True
+        return self.attackers_to(square, color) != 0
+
+    def in_check(self) -> bool:
+        king = self.bitboards[Game.KING | self.side_to_move]
+        return self.is_square_being_attacked_by_color(Square.from_index(king.bit_length() - 1), Game.WHITE-self.side_to_move)
+
+    def is_repetition(self) -> bool:
+        # true if the current position already happened since the last irreversible move,
+        # the undo stack keeps the hash of the position before each move as its last item
+        plies = len(self.undo_stack) if self.hm_since_irreversible is None else min(self.hm_since_irreversible, len(self.undo_stack))
+        # only positions with the same side to move, every other ply
+        for back in range(2, plies + 1, 2):
+            if self.undo_stack[-back][-1] == self.hash:
+                return True
         return False
 
     def instances_of_piece(self, piece: Piece) -> list[Square]:
-        instances = []
-        for square in Square.all_squares():
-            if self.get_square(square):
-                if self.get_square(square).fen_piece == piece.fen_piece:
-                    instances.append(square)
-        return instances
+        squares = Square.all_squares()
+        return [squares[index] for index in Bitboard.indices(self.bitboards[piece.engine_piece])]
 
     def pieces_mask(self, color: int) -> list[bool]:
-        mask = []
-        for square in Square.all_squares():
-            if self.get_square(square):
-                if self.get_square(square).color == color:
-                    mask.append(True)
-                    continue
-            mask.append(False)
-        return mask
+        mask = self.color_mask(color)
+        return [bool(mask >> index & 1) for index in range(64)]
+
+    def pinned_pieces(self, king_index: int, color: int) -> dict[int, int]:
+        # maps every absolutely pinned piece of color to the mask it can still move in,
+        # the line from its king to the pinner, pinner included
+        enemy_color = Game.WHITE-color
+        own = self.occupancy[color >> 3]
+        occupied = self.occupancy[0] | self.occupancy[1]
+        queens = self.bitboards[enemy_color | Game.QUEEN]
+        pins = {}
+        for directions, sliders in ((Bitboard.ROOK_DIRECTIONS, self.bitboards[enemy_color | Game.ROOK] | queens),
+                                    (Bitboard.BISHOP_DIRECTIONS, self.bitboards[enemy_color | Game.BISHOP] | queens)):
+            for direction in directions:
+                ray = Bitboard.RAY_MASKS[direction][king_index]
+                if not ray & sliders: continue # no slider able to pin from here
+                blockers = ray & occupied
+                first = Bitboard.closest(blockers, direction)
+                if not own >> first & 1: continue
+                # own piece first, pinned if the next piece behind it is the slider
+                behind = blockers & Bitboard.RAY_MASKS[direction][first]
+                if not behind: continue
+                second = Bitboard.closest(behind, direction)
+                if sliders >> second & 1:
+                    pins[first] = Bitboard.RAY_TO[king_index][second]
+        return pins
 
     def generate_legal_moves(self) -> list[Move]:
-        pseudo_legal_moves = []
-        legal_moves = []
+        return [Move(code, self) for code in self.generate_legal_move_codes()]
+
+    def generate_legal_move_codes(self, stage: int = ALL_MOVES, sources: int = Bitboard.FULL) -> list[int]:
+        """
+        Legal moves as encoded ints (see Move), what perft and search work with.
+        :param stage: ALL_MOVES, TACTICAL_MOVES (captures and promotions) or QUIET_MOVES (the rest, castling included),
+        so a search can generate the moves it is most likely to cut off with first, and the others only when needed.
+        :param sources: Only moves of the pieces on these squares, used to check a single move is legal.
+        """
         color = self.side_to_move
-        mask = self.pieces_mask(color)
-        for square in Square.all_squares():
-            if mask[square.to_1dimensional_index()]: # little optimization to only look at squares with own pieces
-                pseudo_legal_moves += PieceMoves.generate_moves(self, square)
-
-        for move in pseudo_legal_moves:
-            new_board = self.branch_move(move)
-
-            #check king square after moving, in case of a king move
-            own_king = new_board.instances_of_piece(Piece(Game.KING | color))
-            # error checking
-            if len(own_king) != 1:
-                raise Exception(f"Invalid position, {len(own_king)} {"white" if color == Game.WHITE else "black"} king's.\nFEN:\n{new_board.fen}")
-
-            king_square = own_king[0]
-            if not new_board.is_square_being_attacked_by_color(king_square, Game.WHITE-color): # color inverse
+        enemy_color = Game.WHITE-color
+        squares = Square.all_squares()
+        own_king = self.bitboards[Game.KING | color]
+        # error checking
+        if own_king.bit_count() != 1:
+            raise Exception(f"Invalid position, {own_king.bit_count()} {"white" if color == Game.WHITE else "black"} king's.\nFEN:\n{self.fen}")
+        king_index = own_king.bit_length() - 1
+        checkers = self.attackers_to(squares[king_index], enemy_color)
+
+        # the tactical stage uses the capture generators, the quiet one restricts the end squares to empty ones
+        if stage == Board.QUIET_MOVES:
+            targets = ~self.get_occupied() & Bitboard.FULL
+            pawn_targets = targets & ~(Bitboard.RANK_8 | Bitboard.RANK_1)
+        else:
+            targets = pawn_targets = Bitboard.FULL
+
+        # king moves are checked with the king lifted off the board, so it can't block a slider attacking the square behind it
+        # castling is only generated when not in check, and the king generator already checks its path
+        legal_moves = []
+        if own_king & sources:
+            occupied_without_king = self.get_occupied() ^ own_king
+            if stage == Board.TACTICAL_MOVES:
+                king_moves = PieceMoves.king_captures(self, squares[king_index])
+            else:
+                king_moves = PieceMoves.king(self, squares[king_index], bool(checkers), targets)
+            for move in king_moves:
+                if move >> 12 & 7 == Move.CASTLING or not self.attackers_to(squares[move >> 6 & 63], enemy_color, occupied_without_king):
+                    legal_moves.append(move)
+        if checkers.bit_count() > 1:
+            # double check, only the king can move
+            return legal_moves
+
+        # in check, every other move has to capture the checker or block its line
+        evasions = Bitboard.RAY_TO[king_index][checkers.bit_length() - 1] if checkers else Bitboard.FULL
+        pins = self.pinned_pieces(king_index, color)
+        pawns = self.bitboards[color | Game.PAWN]
+        for index in Bitboard.indices((self.color_mask(color) ^ own_king) & sources): # only look at squares with own pieces
+            allowed = evasions & pins.get(index, Bitboard.FULL) & (pawn_targets if pawns >> index & 1 else targets)
+            if stage == Board.TACTICAL_MOVES:
+                piece_moves = PieceMoves.generate_captures(self, squares[index], allowed)
+            else:
+                piece_moves = PieceMoves.generate_moves(self, squares[index], allowed=allowed)
+            for move in piece_moves:
+                # en passant removes two pieces from the same rank, which can uncover the king in ways pins don't catch,
+                # so it's the only move played out to check it
+                if move >> 12 & 7 == Move.EN_PASSANT and (stage == Board.QUIET_MOVES or not self.is_legal_after_playing(move)): continue
                 legal_moves.append(move)
         return legal_moves
 
-    def branch_move(self, move: Move | str) -> Board:
-        if type(move) is str: move = Move(Square(move[0]+move[1]), Square(move[2]+move[3]), board=self)
-        piece_moving = self.get_square(move.start_square)
-        if not piece_moving: raise Exception(f"Invalid starting position, {move.start_square.get()} in position:\n{self.fen}")
-        potential_piece_captured = self.get_square(move.end_square)
-        new_board = self.array.copy()
-        new_board[move.start_square.to_1dimensional_index()] = None # lift piece
-
-        promoting = piece_moving.engine_type == Game.PAWN and (move.end_square.rank == 1 or move.end_square.rank == 8)
-        if promoting:
-            new_board[move.end_square.to_1dimensional_index()] = move.promotion # place down promotion piece
+    def is_legal_after_playing(self, move: Move | int) -> bool:
+        color = self.side_to_move
+        self.make_move(move)
+        king_square = Square.all_squares()[self.bitboards[Game.KING | color].bit_length() - 1]
+        legal = not self.is_square_being_attacked_by_color(king_square, Game.WHITE-color)
+        self.unmake_move()
+        return legal
+
+    def get_move(self, engine_move: str) -> Move:
+        # finds the legal move matching a long algebraic string (e2e4, e7e8q), so promotion,
+        # castling and en passant information is filled in
+        for move in self.generate_legal_moves():
+            if move.engine_move == engine_move: return move
+        raise ValueError(f"Illegal move {engine_move} in position:\n{self.fen}")
+
+    def put_piece(self, index: int, piece: Piece) -> None:
+        bit = 1 << index
+        self.array[index] = piece
+        self.bitboards[piece.engine_piece] |= bit
+        self.occupancy[piece.color >> 3] |= bit
+        self.hash ^= Zobrist.PIECES[piece.engine_piece][index]
+        self.mg_score += Evaluation.MG_TABLES[piece.engine_piece][index]
+        self.eg_score += Evaluation.EG_TABLES[piece.engine_piece][index]
+        self.phase += Evaluation.PHASE_WEIGHTS[piece.engine_type]
+
+    def remove_piece(self, index: int) -> Piece:
+        piece = self.array[index]
+        bit = 1 << index
+        self.array[index] = None
+        self.bitboards[piece.engine_piece] ^= bit
+        self.occupancy[piece.color >> 3] ^= bit
+        self.hash ^= Zobrist.PIECES[piece.engine_piece][index]
+        self.mg_score -= Evaluation.MG_TABLES[piece.engine_piece][index]
+        self.eg_score -= Evaluation.EG_TABLES[piece.engine_piece][index]
+        self.phase -= Evaluation.PHASE_WEIGHTS[piece.engine_type]
+        return piece
+
+    def make_move(self, move: Move | int | str) -> None:
+        if type(move) is str: move = self.get_move(move)
+        code = move if type(move) is int else move.code
+        start = code & 63
+        end = code >> 6 & 63
+        kind = code >> 12 & 7
+        piece_moving = self.array[start]
+        if not piece_moving: raise Exception(f"Invalid starting position, {Move.engine_move_of(code)} in position:\n{self.fen}")
+        color = piece_moving.color
+        is_pawn = piece_moving.engine_type == Game.PAWN
+
+        captured_index = end
+        if kind == Move.EN_PASSANT:
+            # captured pawn sits behind the end square from the capturing side
+            captured_index = end+8 if color == Game.WHITE else end-8
+        captured = self.array[captured_index]
+
+        self.undo_stack.append((code, piece_moving, captured, captured_index, self.castling_capabilities,
+                                self.en_passant_squares, self.hm_since_irreversible, self.full_moves, self.hash))
+
+        if captured: self.remove_piece(captured_index)
+        self.remove_piece(start) # lift piece
+        if kind >= Move.PROMOTION:
+            # place down promotion piece
+            self.put_piece(end, Piece(color | (kind - Move.PROMOTION + Game.KNIGHT)))
         else:
-            new_board[move.end_square.to_1dimensional_index()] = piece_moving # place down original piece (possible capture)
-        if move.is_en_passant:
-            # obliterate pawn from up/down depending on color
-            new_board[move.end_square.get_offset((0, -1) if piece_moving.color == Game.WHITE else (0, 1))] = None
-        castling = piece_moving.engine_type == Game.KING and abs(move.start_square.file - move.end_square.file) == 2
-        if castling:
-            # if kingside
-            if move.end_square.file == 7:
-                new_board[move.end_square.get_offset((1, 0)).to_1dimensional_index()] = None # lift kingside rook
-                new_board[move.start_square.get_offset((1, 0)).to_1dimensional_index()] = piece_moving.color | Game.ROOK # place kingside rook
-            else: # move.end_square.file should be 3
-                new_board[move.end_square.get_offset((-2, 0)).to_1dimensional_index()] = None # lift queenside rook
-                new_board[move.start_square.get_offset((-1, 0)).to_1dimensional_index()] = piece_moving.color | Game.ROOK # place queenside rook
-
-        # parse board
-        new_fen = Board.array_to_fen(new_board)
-
-        # toggle color to move
-        new_side_to_move = 'b' if self.side_to_move == Game.WHITE else 'w'
+            # place down original piece
+            self.put_piece(end, piece_moving)
+
+        if kind == Move.CASTLING:
+            if end > start: # kingside
+                self.put_piece(end-1, self.remove_piece(end+1))
+            else: # queenside
+                self.put_piece(end+1, self.remove_piece(end-2))
 
         # castling rights
-        new_castling_rights = self.castling_capabilities
-        if self.castling_capabilities:
+        if self.castling_capabilities != '-':
+            lost = Board._CASTLING_ROOK_SQUARES.get(start, '') + Board._CASTLING_ROOK_SQUARES.get(end, '')
             if piece_moving.engine_type == Game.KING:
                 # king moved, remove both castlings
-                new_castling_rights = new_castling_rights.replace('K' if piece_moving.color == Game.WHITE else 'k', '')
-                new_castling_rights = new_castling_rights.replace('Q' if piece_moving.color == Game.WHITE else 'q', '')
-            else:
-                if 'k' in new_castling_rights:
-                    if move.end_square == Square('h8') or move.start_square == Square('h8'): # king rook square
-                        # king rook captured or moved
-                        new_castling_rights = new_castling_rights.replace('k', '')
-                if 'K' in new_castling_rights:
-                    if move.end_square == Square('h1') or move.start_square == Square('h1'): # king rook square
-                        # king rook captured or moved
-                        new_castling_rights = new_castling_rights.replace('K', '')
-                if 'q' in new_castling_rights:
-                    if move.end_square == Square('a8') or move.start_square == Square('a8'): # queen rook square
-                        # queen rook captured or moved
-                        new_castling_rights = new_castling_rights.replace('q', '')
-                if 'Q' in new_castling_rights:
-                    if move.end_square == Square('a1') or move.start_square == Square('a1'): # queen rook square
-                        # queen rook captured or moved
-                        new_castling_rights = new_castling_rights.replace('Q', '')
-        if new_castling_rights == "" or new_castling_rights == None: new_castling_rights = "-"
+                lost += 'KQ' if color == Game.WHITE else 'kq'
+            if lost:
+                new_castling_rights = self.castling_capabilities
+                for right in lost:
+                    new_castling_rights = new_castling_rights.replace(right, '')
+                new_castling_rights = new_castling_rights if new_castling_rights else '-'
+                self.hash ^= Zobrist.castling_key(self.castling_capabilities) ^ Zobrist.castling_key(new_castling_rights)
+                self.castling_capabilities = new_castling_rights
 
         # en passant squares
-        new_en_passant = '-'
-        left_square = move.end_square.get_offset((-1, 0))
-        right_square = move.start_square.get_offset((1, 0))
-        left_piece = self.get_square(left_square) if left_square else None
-        right_piece = self.get_square(right_square) if right_square else None
-        is_pawn_double_push = piece_moving.engine_type == Game.PAWN and ((move.start_square.rank == 2 and move.end_square.rank == 4) or (move.start_square.rank == 7 and move.end_square.rank == 5))
-        if is_pawn_double_push:
-            if left_piece:
-                if left_piece.color != piece_moving.color and left_piece.engine_piece == Game.PAWN:
-                    # enemy color pawn
-                    # set en_passant square from color
-                    new_en_passant = move.start_square.get_offset((0, -1)).get() if piece_moving.color == Game.BLACK else move.start_square.get_offset((0, 1)).get()
-            # separate if statements to avoid AttributeError
-            elif right_piece: # elif because either of them work, skips redundant reasignation
-                if right_piece.color != piece_moving.color and right_piece.engine_piece == Game.PAWN:
-                    # enemy color pawn
-                    new_en_passant = move.start_square.get_offset((0, -1)).get() if piece_moving.color == Game.BLACK else move.start_square.get_offset((0, 1)).get()
-
-        # irreversible half-move clock
-        new_hm_since_irreversible = self.hm_since_irreversible + 1
-        # reset if pawn move or capture
-        if self.get_square(move.start_square).engine_type == Game.PAWN or potential_piece_captured:
-            new_hm_since_irreversible = 0
-
-        # full move counter
-        new_full_moves = self.full_moves
-        # increment on black's move
-        if piece_moving.color == Game.BLACK:
-            new_full_moves += 1
-
-        return Board(" ".join(
-            [new_fen, new_side_to_move, new_castling_rights, new_en_passant, str(new_hm_since_irreversible), str(new_full_moves)]))
-
+        self.hash ^= Zobrist.en_passant_key(self.en_passant_squares)
+        self.en_passant_squares = None
+        if kind == Move.DOUBLE_PUSH:
+            # skipped square, only recorded when an enemy pawn is able to capture onto it
+            passed = (start + end) // 2
+            # squares from where an enemy pawn attacks the skipped square are the ones an own pawn would attack from it
+            if Bitboard.PAWN_ATTACKS[color >> 3][passed] & self.bitboards[(Game.WHITE-color) | Game.PAWN]:
+                self.en_passant_squares = Square.all_squares()[passed]
+                self.hash ^= Zobrist.en_passant_key(self.en_passant_squares)
+
+        # irreversible half-move clock, reset if pawn move or capture
+        if is_pawn or captured:
+            self.hm_since_irreversible = 0
+        elif self.hm_since_irreversible is not None:
+            self.hm_since_irreversible += 1
+
+        # full move counter, increment on black's move
+        if color == Game.BLACK and self.full_moves is not None:
+            self.full_moves += 1
+
+        self.side_to_move = Game.WHITE-color
+        self.hash ^= Zobrist.WHITE_TO_MOVE
+
+    def unmake_move(self) -> None:
+        (code, piece_moving, captured, captured_index, self.castling_capabilities,
+         self.en_passant_squares, self.hm_since_irreversible, self.full_moves, saved_hash) = self.undo_stack.pop()
+        start = code & 63
+        end = code >> 6 & 63
+
+        self.remove_piece(end)
+        self.put_piece(start, piece_moving)
+        if captured: self.put_piece(captured_index, captured)
+
+        if code >> 12 & 7 == Move.CASTLING:
+            # put castled rook back in its corner
+            if end > start:
+                self.put_piece(end+1, self.remove_piece(end-1))
+            else:
+                self.put_piece(end-2, self.remove_piece(end+1))
+
+        self.side_to_move = piece_moving.color
+        self.hash = saved_hash # piece moves above already toggled it back, but the saved key also covers rights and en passant
+
+    def copy(self) -> Board:
+        new_board = Board.__new__(Board)
+        new_board.array = self.array.copy()
+        new_board.bitboards = self.bitboards.copy()
+        new_board.occupancy = self.occupancy.copy()
+        new_board.side_to_move = self.side_to_move
+        new_board.castling_capabilities = self.castling_capabilities
+        new_board.en_passant_squares = self.en_passant_squares
+        new_board.hm_since_irreversible = self.hm_since_irreversible
+        new_board.full_moves = self.full_moves
+        new_board.hash = self.hash
+        new_board.mg_score = self.mg_score
+        new_board.eg_score = self.eg_score
+        new_board.phase = self.phase
+        new_board.undo_stack = []
+        return new_board
 
+    def branch_move(self, move: Move | str) -> Board:
+        # non mutating version of make_move, returns a new board with the move played
+        new_board = self.copy()
+        new_board.make_move(move)
+        return new_board
 
     @staticmethod
     def array_to_fen(array: list["Piece | None"]) -> str:
@@ -328,44 +859,174 @@ class Board:
         return compressed
 
 class Move:
-    def __init__(self, start_square: Square, end_square: Square, promotion: Piece | None=None, is_en_passant: bool = False, is_not_controlling: bool = False, board: Board=None):
-        self.start_square = start_square
-        self.end_square: Square = end_square
-        self.promotion = promotion
-        self.engine_move = start_square.get() + end_square.get() + (promotion.fen_piece.lower() if promotion else '')
-        self.is_en_passant = is_en_passant
-        self.is_not_controlling = is_not_controlling # pawn moves
-        if board:
-            self.current_board = board
-            self.piece = board.get_square(start_square)
-            self.is_capture = board.get_square(end_square) is not None
+    # moves are generated as plain ints, Move only wraps one when the details are needed
+    # bits 0-5 start square index, 6-11 end square index, 12-15 flags,
+    # 16-19 engine piece moving, 20-23 engine piece captured (only meaningful with the CAPTURE flag)
+    QUIET = 0
+    DOUBLE_PUSH = 1
+    CASTLING = 2
+    EN_PASSANT = 3
+    PROMOTION = 4 # 4 to 7, promoting to knight, bishop, rook or queen
+    CAPTURE = 8 # combined with any of the above
+
+    __slots__ = ('code', 'current_board')
+
+    def __init__(self, code: int, board: Board=None):
+        self.code = code
+        # position the move was generated in, piece and san are read from there
+        self.current_board = board
+
+    @staticmethod
+    def encode(start: int, end: int, flags: int, piece: int, captured: int = 0) -> int:
+        return start | end << 6 | flags << 12 | piece << 16 | captured << 20
+
+    @staticmethod
+    def engine_move_of(code: int) -> str:
+        squares = Square.all_squares()
+        engine_move = squares[code & 63].get() + squares[code >> 6 & 63].get()
+        kind = code >> 12 & 7
+        if kind >= Move.PROMOTION:
+            engine_move += Piece.engine_piece_to_fen_piece(kind - Move.PROMOTION + Game.KNIGHT)
+        return engine_move
+
+    @property
+    def start_square(self) -> Square:
+        return Square.all_squares()[self.code & 63]
+
+    @property
+    def end_square(self) -> Square:
+        return Square.all_squares()[self.code >> 6 & 63]
+
+    @property
+    def piece(self) -> Piece:
+        return Piece(self.code >> 16 & 15)
+
+    @property
+    def is_capture(self) -> bool:
+        return bool(self.code >> 12 & Move.CAPTURE)
+
+    @property
+    def captured(self) -> Piece | None:
+        return Piece(self.code >> 20 & 15) if self.is_capture else None
+
+    @property
+    def promotion(self) -> Piece | None:
+        kind = self.code >> 12 & 7
+        if kind < Move.PROMOTION: return None
+        return Piece(self.piece.color | (kind - Move.PROMOTION + Game.KNIGHT))
+
+    @property
+    def is_en_passant(self) -> bool:
+        return self.code >> 12 & 7 == Move.EN_PASSANT
+
+    @property
+    def is_castling(self) -> bool:
+        return self.code >> 12 & 7 == Move.CASTLING
+
+    @property
+    def is_not_controlling(self) -> bool:
+        # pawn advances, they don't attack the square they move to
+        return self.piece.engine_type == Game.PAWN and not self.is_capture
+
+    @property
+    def engine_move(self) -> str:
+        return Move.engine_move_of(self.code)
+
+    @property
+    def san(self) -> str:
+        return self.generate_san()
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Move) and other.code == self.code
+
+    def __hash__(self) -> int:
+        return hash(self.code)
+
+    def __repr__(self) -> str:
+        return f"Move({self.engine_move})"
 
     def generate_san(self) -> str:
         if self.piece.engine_type == Game.PAWN:
             if self.start_square.file == self.end_square.file:
                 # normal movement (e4)
-                self.san = self.end_square.get()
+                san = self.end_square.get()
             else:
                 # capture (exd5)
-                self.san = self.start_square.get_file() + "x" + self.end_square.get()
+                san = self.start_square.get_file() + "x" + self.end_square.get()
         else:
             # setting first letter of the san to be the piece
-            self.san = self.piece.fen_piece.upper()
+            san = self.piece.fen_piece.upper()
             # add disambiguation after piece type
-            self.san += PieceMoves.disambiguate_for(self)
+            san += PieceMoves.disambiguate_for(self)
             # if capture indicate so
-            if self.is_capture: self.san += 'x'
+            if self.is_capture: san += 'x'
             # finally, end square
-            self.san += self.end_square.get()
-        return self.san
-
+            san += self.end_square.get()
+        return san
+
+
+class PerftCache:
+    # fixed memory hash table of perft subtree node counts, keyed by (zobrist key, depth)
+    # slots are grouped in buckets of two: the first one keeps the deepest (most expensive) subtree,
+    # the second one is always replaced, so fresh entries always find a place
+    BUCKET_SIZE = 2
+    _BYTES_PER_SLOT = 8 + 8 + 1 # key, count and depth
+
+    def __init__(self, size_mb: float = 16):
+        slots = max(self.BUCKET_SIZE, int(size_mb * 1024 * 1024) // PerftCache._BYTES_PER_SLOT)
+        # power of two amount of buckets, so a bucket is found by masking the key
+        self.bucket_mask = (1 << ((slots // self.BUCKET_SIZE).bit_length() - 1)) - 1
+        self.size = (self.bucket_mask + 1) * self.BUCKET_SIZE
+        self.keys = array('Q', bytes(8 * self.size))
+        self.counts = array('Q', bytes(8 * self.size))
+        self.depths = array('B', bytes(self.size)) # depth 0 is never stored, so it marks an empty slot
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def clear(self) -> None:
+        self.keys = array('Q', bytes(8 * self.size))
+        self.counts = array('Q', bytes(8 * self.size))
+        self.depths = array('B', bytes(self.size))
+        self.reset_stats()
+
+    def probe(self, key: int, depth: int) -> int | None:
+        slot = (key & self.bucket_mask) * self.BUCKET_SIZE
+        for i in range(slot, slot + self.BUCKET_SIZE):
+            if self.depths[i] == depth and self.keys[i] == key:
+                self.hits += 1
+                return self.counts[i]
+        self.misses += 1
+        return None
+
+    def store(self, key: int, depth: int, count: int) -> None:
+        slot = (key & self.bucket_mask) * self.BUCKET_SIZE
+        if depth < self.depths[slot]:
+            # depth preferred slot holds a bigger subtree, use the always replace one
+            slot += 1
+        if self.depths[slot]:
+            self.replacements += 1
+        self.keys[slot] = key
+        self.counts[slot] = count
+        self.depths[slot] = depth
+        self.stores += 1
+
+    def stats(self) -> dict[str, int | float]:
+        probes = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / probes if probes else 0.0,
+                'stores': self.stores, 'replacements': self.replacements,
+                'filled': self.size - self.depths.count(0), 'size': self.size}
 
 class PieceMoves:
     @staticmethod
     def disambiguate_for(move: Move) -> str:
         colliding_moves = []
         for m in move.current_board.generate_legal_moves():
-            if m.end_square == move.end_square and m.piece == move.piece and m.start_square != move.start_square:
+            if m.end_square == move.end_square and m.piece is move.piece and m.start_square != move.start_square:
                 # uh-oh, must disambiguate, both moves would come to the same san
                 colliding_moves.append(m)
         if len(colliding_moves) == 0: return ''# early return
@@ -383,192 +1044,270 @@ class PieceMoves:
         return move.start_square.get_file()
 
     @staticmethod
-    def perft(position: Board, depth: int, recursive=False):
+    def perft(position: Board, depth: int, recursive=False, cache: PerftCache | None = None):
         if depth == 0:
             return 1  # a leaf node counts as 1
         if not recursive:
             divisions = {}
-
-        legal_moves = position.generate_legal_moves()
+        elif depth == 1:
+            # every legal move is a leaf, no need to play them, cheaper than a cache lookup so never stored
+            return len(position.generate_legal_move_codes())
+        elif cache is not None:
+            # transposed subtree already counted
+            cached = cache.probe(position.hash, depth)
+            if cached is not None: return cached
+
+        legal_moves = position.generate_legal_move_codes()
         count = 0
         for m in legal_moves:
-            new_pos = position.branch_move(m)
-            subcount = PieceMoves.perft(new_pos, depth - 1, recursive=True)
+            position.make_move(m)
+            subcount = PieceMoves.perft(position, depth - 1, recursive=True, cache=cache)
+            position.unmake_move()
             count += subcount
             if not recursive:
                 # divided perft
                 # print(f'{m.engine_move}: {subcount}')
-                divisions[m.engine_move] = subcount
+                divisions[Move.engine_move_of(m)] = subcount
 
         if not recursive:
             # print(f'Total: {count}')
             # divisions['Total'] = count
             return divisions
+        if cache is not None:
+            cache.store(position.hash, depth, count)
         return count
 
     @staticmethod
-    def pawn(board: Board, pos: Square) -> list[Move]:
+    def split_paths(position: Board, depth: int) -> list[list[str]]:
+        # every line of legal moves of the given length, as engine moves from the position
+        if depth == 0:
+            return [[]]
+        paths = []
+        for m in position.generate_legal_move_codes():
+            position.make_move(m)
+            paths += [[Move.engine_move_of(m)] + rest for rest in PieceMoves.split_paths(position, depth - 1)]
+            position.unmake_move()
+        return paths
+
+    @staticmethod
+    def parallel_perft(position: Board, depth: int, workers: int | None = None, split_depth: int = 1, cache_mb: float = 0):
+        """
+        Divided perft spread over a process pool, returns the same as perft.
+        :param position: Root position.
+        :param depth: Perft depth.
+        :param workers: Amount of processes, defaults to the cpu count.
+        :param split_depth: Plies expanded in this process, every line of that length is a task for the pool.
+        :param cache_mb: Size of the PerftCache kept by each worker, 0 for none.
+        :return: Node count per root move.
+        """
+        if depth == 0:
+            return PieceMoves.perft(position, depth)
+        split_depth = max(1, min(split_depth, depth))
+        fen = position.fen
+        # root moves with no lines at the split depth (mate or stalemate right after) still count as 0
+        divisions = {m.engine_move: 0 for m in position.generate_legal_moves()}
+        paths = PieceMoves.split_paths(position, split_depth)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=PARALLEL_CONTEXT, initializer=_init_perft_worker,
+                                 initargs=(cache_mb,)) as pool:
+            futures = {pool.submit(_perft_task, fen, path, depth - split_depth): path[0] for path in paths}
+            for future in as_completed(futures):
+                divisions[futures[future]] += future.result()
+        return divisions
+
+    @staticmethod
+    def moves_to(board: Board, pos: Square, targets: int, flags: int = Move.QUIET) -> list[int]:
+        # encoded moves from pos to every square in targets, capture flag and captured piece filled from the board
+        start = pos.index
+        base = Move.encode(start, 0, flags, board.array[start].engine_piece)
+        array = board.array
+        moves = []
+        for index in Bitboard.indices(targets):
+            captured = array[index]
+            if captured:
+                moves.append(base | index << 6 | Move.CAPTURE << 12 | captured.engine_piece << 20)
+            else:
+                moves.append(base | index << 6)
+        return moves
+
+    @staticmethod
+    def pawn(board: Board, pos: Square, allowed: int = Bitboard.FULL) -> list[int]:
         # Error checking
         if pos.rank in [1, 8]: raise Exception("Pawn in first/last rank, impossible")
 
         moves = []
         pawn = board.get_square(pos)
         enemy_color = abs(Game.WHITE-pawn.color)
-        forward = pos.get_offset((0, 1)) if pawn.color == Game.WHITE else pos.get_offset((0, -1))
-        left_capture = pos.get_offset((-1, 1)) if pawn.color == Game.WHITE else pos.get_offset((-1, -1))
-        right_capture = pos.get_offset((1, 1)) if pawn.color == Game.WHITE else pos.get_offset((1, -1))
-        double_forward = pos.get_offset((0, 2)) if pawn.color == Game.WHITE else pos.get_offset((0, -2))
-        promoting = forward.rank in [1, 8]
+        index = pos.index
+        side = pawn.color >> 3
+        empty = ~board.get_occupied()
+        forward = Bitboard.PAWN_PUSHES[side][index] & empty
+        # double push only needs the intermediate square empty, not allowed
+        double_forward = Bitboard.PAWN_DOUBLE_PUSHES[side][index] & empty & allowed if forward else 0
+        forward &= allowed
+        attacks = Bitboard.PAWN_ATTACKS[side][index]
+        captures = attacks & board.color_mask(enemy_color) & allowed
+        promoting = pos.rank == (7 if pawn.color == Game.WHITE else 2)
         promotable = [Game.KNIGHT, Game.BISHOP, Game.ROOK, Game.QUEEN]
         if promoting:
-            if not board.get_square(forward):
-                for piece in promotable:
-                    moves.append(Move(pos, forward, Piece(piece), board=board, is_not_controlling=True))
-            if pos.file != 1:
-                # Not in A file, check diagonal left capture
-                if board.get_square(left_capture) and board.get_square(left_capture).color == enemy_color:
-                    for piece in promotable:
-                        moves.append(Move(pos, left_capture, Piece(piece), board=board))
-            if pos.file != 8:
-                # Not in H file, check diagonal right capture
-                if board.get_square(right_capture) and board.get_square(right_capture).color == enemy_color:
-                    for piece in promotable:
-                        moves.append(Move(pos, right_capture, Piece(piece), board=board))
+            for piece in promotable:
+                promotion_flag = Move.PROMOTION + piece - Game.KNIGHT
+                moves += PieceMoves.moves_to(board, pos, forward | captures, promotion_flag)
         # Double move and en passant skipped when promoting,
         # such situations are imposible to happen in any chess position
         else:
-            if not board.get_square(forward):
-                # Ahead clear
-                moves.append(Move(pos, forward, board=board, is_not_controlling=True))
-            if pos.file != 1:
-                # Not in A file, check diagonal left capture
-                if board.get_square(left_capture) and board.get_square(left_capture).color == enemy_color:
-                    moves.append(Move(pos, left_capture, board=board))
-            if pos.file != 8:
-                # Not in H file, check diagonal right capture
-                if board.get_square(right_capture) and board.get_square(right_capture).color == enemy_color:
-                    moves.append(Move(pos, right_capture, board=board))
-            if (pos.rank == 2 and pawn.color == Game.WHITE) or (pos.rank == 7 and pawn.color == Game.BLACK):
-                if not board.get_square(double_forward) and not board.get_square(forward):
-                    # Checks both final and intermediate square
-                    moves.append(Move(pos, double_forward, board=board, is_not_controlling=True))
-            if board.en_passant_squares in [left_capture, right_capture] and board.en_passant_squares:
-                if board.get_square(board.en_passant_squares.get_offset((0, -1) if pawn.color == Game.WHITE else (0, 1))).color == enemy_color:
-                    # En passant is possible in FEN and that the pawn en_passant references is of the opposite color
-                    # (offset because pawn is in the square after the mentioned one in the FEN)
-                    moves.append(Move(pos, board.en_passant_squares, board=board, is_en_passant=True))
+            moves += PieceMoves.moves_to(board, pos, forward | captures)
+            # Checks both final and intermediate square, only set for pawns on their starting rank
+            moves += PieceMoves.moves_to(board, pos, double_forward, Move.DOUBLE_PUSH)
+            moves += PieceMoves.en_passant(board, pos)
         return moves
 
     @staticmethod
-    def non_sliding_piece(board: Board, pos: Square, offsets) -> list[Move]:
+    def en_passant(board: Board, pos: Square) -> list[int]:
+        # en passant ignores allowed, the captured pawn isn't on the end square, legality is left to the caller
+        if not board.en_passant_squares: return []
+        pawn = board.get_square(pos)
+        enemy_color = Game.WHITE-pawn.color
+        en_passant_index = board.en_passant_squares.index
+        # pawn referenced by en passant sits one square past the en passant square, from the capturing side
+        captured = Bitboard.PAWN_PUSHES[enemy_color >> 3][en_passant_index]
+        if Bitboard.PAWN_ATTACKS[pawn.color >> 3][pos.index] & (1 << en_passant_index) and captured & board.bitboards[enemy_color | Game.PAWN]:
+            return [Move.encode(pos.index, en_passant_index, Move.EN_PASSANT | Move.CAPTURE, pawn.engine_piece, enemy_color | Game.PAWN)]
+        return []
+
+    @staticmethod
+    def pawn_captures(board: Board, pos: Square, allowed: int = Bitboard.FULL) -> list[int]:
+        # captures and promotions only, including promotions by pushing, what quiescence search looks at
+        pawn = board.get_square(pos)
+        enemy_color = Game.WHITE-pawn.color
+        index = pos.index
+        side = pawn.color >> 3
+        captures = Bitboard.PAWN_ATTACKS[side][index] & board.color_mask(enemy_color) & allowed
+        if pos.rank == (7 if pawn.color == Game.WHITE else 2):
+            forward = Bitboard.PAWN_PUSHES[side][index] & ~board.get_occupied() & allowed
+            moves = []
+            for piece in [Game.KNIGHT, Game.BISHOP, Game.ROOK, Game.QUEEN]:
+                moves += PieceMoves.moves_to(board, pos, forward | captures, Move.PROMOTION + piece - Game.KNIGHT)
+            return moves
+        return PieceMoves.moves_to(board, pos, captures) + PieceMoves.en_passant(board, pos)
+
+    @staticmethod
+    def non_sliding_piece(board: Board, pos: Square, attacks: int) -> list[int]:
         own_color = board.get_square(pos).color
-        moves = []
-        for target_offset in offsets:
-            new_square = pos.get_offset(target_offset)
-            if not new_square: continue # outside board
-            target_square = board.get_square(new_square)
-            if target_square:
-                # if there's a piece
-                if target_square.color == own_color:
-                    # and is from the ally color, invalidate move
-                    # if statements separated to evade AttributeError when checking None.color
-                    continue
-            # elif theres no piece or its from enemy color, count move
-            moves.append(Move(pos, new_square, board=board))
-        return moves
+        # every attacked square is a move unless an ally piece stands there, empty squares and captures alike
+        return PieceMoves.moves_to(board, pos, attacks & ~board.color_mask(own_color))
 
     @staticmethod
-    def knight(board: Board, pos: Square) -> list[Move]:
-        # hardcoded knight offsets
-        offsets = [(-1, 2), (1, 2), (-2, 1), (2, 1), (-2, -1), (2, -1), (-1, -2), (1, -2)]
-        return PieceMoves.non_sliding_piece(board, pos, offsets)
+    def knight(board: Board, pos: Square, allowed: int = Bitboard.FULL) -> list[int]:
+        return PieceMoves.non_sliding_piece(board, pos, Bitboard.KNIGHT_ATTACKS[pos.index] & allowed)
 
     @staticmethod
-    def sliding_piece(board: Board, pos: Square, direction_offsets: list[tuple[int, int]]) -> list[Move]:
+    def sliding_piece(board: Board, pos: Square, directions, allowed: int = Bitboard.FULL) -> list[int]:
         own_color = board.get_square(pos).color
-        moves = []
-        for direction in direction_offsets:
-            # inital offset square
-            current_target_square = pos.get_offset(direction)
-            if not current_target_square: continue # outside board
-            while not board.get_square(current_target_square): # while current square empty
-                # add move option
-                moves.append(Move(pos, current_target_square, board=board))
-                # offset current square
-                current_target_square = current_target_square.get_offset(direction)
-                if not current_target_square: break # reached board end
-            if not current_target_square: continue # reached board end, skip color check
-            # current square not empty
-            # add move anyway if capture
-            if board.get_square(current_target_square).color != own_color:
-                # if enemy piece, capture available
-                moves.append(Move(pos, current_target_square, board=board))
-        return moves
+        # rays stop on the first piece found, which is included and then removed if it's an ally
+        attacks = Bitboard.ray_attacks(pos.index, board.get_occupied(), directions)
+        return PieceMoves.moves_to(board, pos, attacks & allowed & ~board.color_mask(own_color))
+
+    @staticmethod
+    def knight_captures(board: Board, pos: Square, allowed: int = Bitboard.FULL) -> list[int]:
+        enemy_color = Game.WHITE-board.get_square(pos).color
+        return PieceMoves.moves_to(board, pos, Bitboard.KNIGHT_ATTACKS[pos.index] & allowed & board.color_mask(enemy_color))
+
+    @staticmethod
+    def sliding_piece_captures(board: Board, pos: Square, directions, allowed: int = Bitboard.FULL) -> list[int]:
+        # the first piece found on every ray, kept only if it's an enemy
+        enemy_color = Game.WHITE-board.get_square(pos).color
+        attacks = Bitboard.ray_attacks(pos.index, board.get_occupied(), directions)
+        return PieceMoves.moves_to(board, pos, attacks & allowed & board.color_mask(enemy_color))
 
     @staticmethod
-    def bishop(board: Board, pos: Square) -> list[Move]:
-        directions = [(-1, 1), (1, 1), (-1, -1), (1, -1)]
-        return PieceMoves.sliding_piece(board, pos, directions)
+    def bishop(board: Board, pos: Square, allowed: int = Bitboard.FULL) -> list[int]:
+        return PieceMoves.sliding_piece(board, pos, Bitboard.BISHOP_DIRECTIONS, allowed)
 
     @staticmethod
-    def rook(board: Board, pos: Square) -> list[Move]:
-        directions = [(0, 1), (-1, 0), (1, 0), (0, -1)]
-        return PieceMoves.sliding_piece(board, pos, directions)
+    def rook(board: Board, pos: Square, allowed: int = Bitboard.FULL) -> list[int]:
+        return PieceMoves.sliding_piece(board, pos, Bitboard.ROOK_DIRECTIONS, allowed)
 
     @staticmethod
-    def queen(board: Board, pos: Square) -> list[Move]:
-        directions = [(-1, 1), (0, 1), (1, 1), (-1, 0), (1, 0), (-1, -1), (0, -1), (1, -1)]
-        return PieceMoves.sliding_piece(board, pos, directions)
+    def queen(board: Board, pos: Square, allowed: int = Bitboard.FULL) -> list[int]:
+        return PieceMoves.sliding_piece(board, pos, Bitboard.QUEEN_DIRECTIONS, allowed)
 
     @staticmethod
-    def king(board: Board, pos: Square, ignore_castling: bool=False) -> list[Move]:
-        offsets = [(-1, 1), (0, 1), (1, 1), (-1, 0), (1, 0), (-1, -1), (0, -1), (1, -1)] # same as queen
-        base_moves = PieceMoves.non_sliding_piece(board, pos, offsets)
+    def king(board: Board, pos: Square, ignore_castling: bool=False, allowed: int = Bitboard.FULL) -> list[int]:
+        index = pos.index
+        base_moves = PieceMoves.non_sliding_piece(board, pos, Bitboard.KING_ATTACKS[index] & allowed)
         if ignore_castling: return base_moves
         castling_moves = []
+        squares = Square.all_squares() # castling squares are on the king's rank, next to it
         color = board.get_square(pos).color
         enemy_color = abs(Game.WHITE-color)
         if board.castling_capabilities:
             # king-side castling
             if board.get_square(pos).fen_piece in board.castling_capabilities:
                 # check clear path
-                if (not board.get_square(pos.get_offset((1, 0)))) and (not board.get_square(pos.get_offset((2, 0)))):
+                if (not board.get_square(squares[index+1])) and (not board.get_square(squares[index+2])):
                     # bishop space and knight space unnocupied
                     if ((not board.is_square_being_attacked_by_color(pos, enemy_color)) # king in peace
-                    and (not board.is_square_being_attacked_by_color(pos.get_offset((1, 0)), enemy_color)) # bishop space in peace
-                    and (not board.is_square_being_attacked_by_color(pos.get_offset((2, 0)), enemy_color))): # knight space in peace
-                        castling_moves.append(Move(pos, pos.get_offset((2, 0)), board=board))
+                    and (not board.is_square_being_attacked_by_color(squares[index+1], enemy_color)) # bishop space in peace
+                    and (not board.is_square_being_attacked_by_color(squares[index+2], enemy_color))): # knight space in peace
+                        castling_moves.append(Move.encode(index, index+2, Move.CASTLING, color | Game.KING))
             # queen-side castling
             fen = 'q' if color == Game.BLACK else 'Q'
             if fen in board.castling_capabilities:
                 # check clear path
-                if ((not board.get_square(pos.get_offset((-1, 0)))) # no queen
-                and (not board.get_square(pos.get_offset((-2, 0)))) # no bishop
-                and (not board.get_square(pos.get_offset((-3, 0))))): # no knight
+                if ((not board.get_square(squares[index-1])) # no queen
+                and (not board.get_square(squares[index-2])) # no bishop
+                and (not board.get_square(squares[index-3]))): # no knight
                     # space clear
                     # check for squares not being attacked
                     if ((not board.is_square_being_attacked_by_color(pos, enemy_color)) # king in peace
-                    and (not board.is_square_being_attacked_by_color(pos.get_offset((-1, 0)), enemy_color)) # queen space in peace
-                    and (not board.is_square_being_attacked_by_color(pos.get_offset((-2, 0)), enemy_color))):  # bishop space in peace
+                    and (not board.is_square_being_attacked_by_color(squares[index-1], enemy_color)) # queen space in peace
+                    and (not board.is_square_being_attacked_by_color(squares[index-2], enemy_color))):  # bishop space in peace
                         # no knight needed, king does not traverse there
-                        castling_moves.append(Move(pos, pos.get_offset((-2, 0)), board=board))
+                        castling_moves.append(Move.encode(index, index-2, Move.CASTLING, color | Game.KING))
 
         return base_moves + castling_moves
 
     @staticmethod
-    def generate_moves(board: Board, pos: Square, ignore_castling: bool=False) -> list[Move]:
+    def king_captures(board: Board, pos: Square, allowed: int = Bitboard.FULL) -> list[int]:
+        # castling never captures
+        enemy_color = Game.WHITE-board.get_square(pos).color
+        return PieceMoves.moves_to(board, pos, Bitboard.KING_ATTACKS[pos.index] & allowed & board.color_mask(enemy_color))
+
+    @staticmethod
+    def generate_captures(board: Board, pos: Square, allowed: int = Bitboard.FULL) -> list[int]:
+        # captures and promotions of the piece on pos, allowed restricts the end squares like in generate_moves
+        piece_type = board.get_square(pos).engine_type
+        match piece_type:
+            case Game.PAWN:
+                return PieceMoves.pawn_captures(board, pos, allowed)
+            case Game.KNIGHT:
+                return PieceMoves.knight_captures(board, pos, allowed)
+            case Game.BISHOP:
+                return PieceMoves.sliding_piece_captures(board, pos, Bitboard.BISHOP_DIRECTIONS, allowed)
+            case Game.ROOK:
+                return PieceMoves.sliding_piece_captures(board, pos, Bitboard.ROOK_DIRECTIONS, allowed)
+            case Game.QUEEN:
+                return PieceMoves.sliding_piece_captures(board, pos, Bitboard.QUEEN_DIRECTIONS, allowed)
+            case Game.KING:
+                return PieceMoves.king_captures(board, pos, allowed)
+            case _:
+                return []
+
+    @staticmethod
+    def generate_moves(board: Board, pos: Square, ignore_castling: bool=False, allowed: int = Bitboard.FULL) -> list[int]:
+        # allowed restricts the end squares, used for pins and check evasions
         piece_type = board.get_square(pos).engine_type
         match piece_type:
             case Game.PAWN:
-                return PieceMoves.pawn(board, pos)
+                return PieceMoves.pawn(board, pos, allowed)
             case Game.KNIGHT:
-                return PieceMoves.knight(board, pos)
+                return PieceMoves.knight(board, pos, allowed)
             case Game.BISHOP:
-                return PieceMoves.bishop(board, pos)
+                return PieceMoves.bishop(board, pos, allowed)
             case Game.ROOK:
-                return PieceMoves.rook(board, pos)
+                return PieceMoves.rook(board, pos, allowed)
             case Game.QUEEN:
-                return PieceMoves.queen(board, pos)
+                return PieceMoves.queen(board, pos, allowed)
             case Game.KING:
                 """
                 ignore castling to avoid infinite recursion, castling irrelevant for controlling squares
@@ -578,18 +1317,34 @@ class PieceMoves:
                 is possible without consequences, because a castling move is not counted as controlling that square (which will always be covered
                 by the tower anyway)
                 """
-                return PieceMoves.king(board, pos, ignore_castling)
+                return PieceMoves.king(board, pos, ignore_castling, allowed)
             case _:
                 return []
 
+# every process pool (parallel_perft, parallel_search, the perft tools) starts its workers from a clean server process
+# instead of forking the caller, a fork would copy the locks other threads hold at that moment (a UCI thread blocked
+# reading stdin, stockfish reader threads) and deadlock the child. spawn is the fallback where forkserver isn't available
+PARALLEL_CONTEXT = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+# per process state for parallel_perft workers
+_worker_perft_cache = None
+
+def _init_perft_worker(cache_mb: float) -> None:
+    global _worker_perft_cache
+    _worker_perft_cache = PerftCache(cache_mb) if cache_mb else None
+
+def _perft_task(fen: str, path: list[str], depth: int) -> int:
+    board = Board(fen)
+    for engine_move in path:
+        board.make_move(engine_move)
+    return PieceMoves.perft(board, depth, recursive=True, cache=_worker_perft_cache)
+
 import stockfish
 def stockfish_perft(position: Board, depth: int) -> dict[str: int]:
-    p = stockfish.start_ink()
-    stockfish.send_command(p, f"position fen {position.fen}")
-    result = stockfish.send_command_and_grab_output(p, f"go perft {depth}")
-    stockfish.close_ink(p)
-    return result
+    # engine processes are kept alive in stockfish's shared pool, recursive comparisons don't pay the startup each time
+    return stockfish.perft(position.fen, depth)
 
+# interactive, prints as it goes; divide_bisect.py does the same search in parallel and returns a report
 def compare_engine_stockfish(position: Board, depth: int, no_recursion: bool=False):
     expected = stockfish_perft(position, depth)
     actual = PieceMoves.perft(position, depth)
@@ -649,10 +1404,7 @@ def compare_engine_stockfish(position: Board, depth: int, no_recursion: bool=Fal
 
 
 
-b = Board("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 0")
-t = time.perf_counter()
-compare_engine_stockfish(b, 2)
-print(time.perf_counter() - t)
+# perft regression checks live in perft_suite.py, over data/perft.epd
 
 # t = Board('rnbqkbnr/1P6/2p1ppp1/1PP1PPP1/8/3p3p/p2P3P/RNBQKBNR b KQkq - 0 19')
 # print([m.engine_move for m in t.generate_legal_moves()])
\ No newline at end of file
@@ -0,0 +1,276 @@
+from __future__ import annotations
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from game import Board, PerftCache, PieceMoves
+
+
+class Instrumentation:
+    # opt-in timing of the move generation hot path. Nothing is wrapped until enable is called, so a disabled run
+    # executes the original functions with no extra cost; enable swaps the targets on their classes for timed
+    # wrappers and disable puts the originals back.
+    # Counts are kept for the calling process only, run perfts and searches with a single worker while enabled.
+    TARGETS = [(Board, 'generate_legal_moves'), (Board, 'generate_legal_move_codes'), (Board, 'make_move'),
+               (Board, 'unmake_move'), (Board, 'branch_move'), (Board, 'copy'), (Board, 'array_to_fen'),
+               (Board, 'attackers_to'), (Board, 'is_square_being_attacked_by_color'), (Board, 'in_check'),
+               (Board, 'pinned_pieces'), (Board, 'is_legal_after_playing'),
+               (PieceMoves, 'generate_moves'), (PieceMoves, 'generate_captures'), (PieceMoves, 'pawn'),
+               (PieceMoves, 'en_passant'), (PieceMoves, 'pawn_captures'), (PieceMoves, 'knight'),
+               (PieceMoves, 'knight_captures'), (PieceMoves, 'bishop'), (PieceMoves, 'rook'), (PieceMoves, 'queen'),
+               (PieceMoves, 'sliding_piece'), (PieceMoves, 'sliding_piece_captures'), (PieceMoves, 'king'),
+               (PieceMoves, 'king_captures'), (PieceMoves, 'moves_to')]
+
+    enabled = False
+    _originals: dict[tuple[type, str], object] = {} # class attribute replaced by each wrapper
+    stats: dict[str, list] = {} # name -> [calls, cumulative seconds, own seconds]
+    collapsed: dict[str, float] = {} # stack of wrapped names, root first and joined by ;, -> own seconds
+    runs: list[dict] = [] # perfts and searches timed by run_perft and run_search
+    _stack: list[str] = []
+    _children: list[float] = [] # time spent in wrapped callees, for every call on the stack
+
+    @staticmethod
+    def enable(targets: list[tuple[type, str]] | None = None) -> None:
+        """
+        Wraps the targets, until disable.
+        :param targets: (class, attribute name) pairs, defaults to TARGETS. Plain functions and staticmethods
+        are supported, generators would only be timed until they return their iterator.
+        """
+        for owner, name in targets or Instrumentation.TARGETS:
+            if (owner, name) in Instrumentation._originals: continue
+            attribute = owner.__dict__[name]
+            is_static = isinstance(attribute, staticmethod)
+            function = attribute.__func__ if is_static else attribute
+            wrapper = Instrumentation.wrap(f"{owner.__name__}.{name}", function)
+            setattr(owner, name, staticmethod(wrapper) if is_static else wrapper)
+            Instrumentation._originals[(owner, name)] = attribute
+        Instrumentation.enabled = True
+
+    @staticmethod
+    def disable() -> None:
+        for (owner, name), attribute in Instrumentation._originals.items():
+            setattr(owner, name, attribute)
+        Instrumentation._originals.clear()
+        Instrumentation.enabled = False
+
+    @staticmethod
+    def reset() -> None:
+        # wrappers keep their stats list, so it is zeroed in place
+        for stat in Instrumentation.stats.values():
+            stat[:] = [0, 0.0, 0.0]
+        Instrumentation.collapsed.clear()
+        Instrumentation.runs.clear()
+
+    @staticmethod
+    def wrap(name: str, function):
+        stat = Instrumentation.stats.setdefault(name, [0, 0.0, 0.0])
+        stack, children, collapsed = Instrumentation._stack, Instrumentation._children, Instrumentation.collapsed
+        perf_counter = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            stack.append(name)
+            children.append(0.0)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                own = elapsed - children.pop()
+                key = ";".join(stack)
+                stack.pop()
+                stat[0] += 1
+                stat[2] += own
+                if name not in stack:
+                    stat[1] += elapsed # recursive calls are already inside the outer one
+                if children:
+                    children[-1] += elapsed
+                collapsed[key] = collapsed.get(key, 0.0) + own
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        wrapper.__wrapped__ = function
+        return wrapper
+
+    @staticmethod
+    def run_perft(board: Board, depth: int, cache_mb: float = 0) -> int:
+        """
+        Timed perft in this process, recorded in runs with its nodes per second.
+        :return: Node count.
+        """
+        cache = PerftCache(cache_mb) if cache_mb else None
+        start = time.perf_counter()
+        nodes = PieceMoves.perft(board, depth, recursive=True, cache=cache)
+        Instrumentation.record_run(f"perft {depth}", board.fen, nodes, time.perf_counter() - start)
+        return nodes
+
+    @staticmethod
+    def run_search(board: Board, max_depth: int, time_limit: float | None = None):
+        """
+        Timed single process search, recorded in runs with its nodes per second.
+        :return: SearchResult of the search.
+        """
+        from search import Search # search imports a lot more than the move generator needs
+        result = Search(board).iterative_deepening(max_depth, time_limit)
+        Instrumentation.record_run(f"search {max_depth}", board.fen, result.nodes, result.elapsed)
+        return result
+
+    @staticmethod
+    def record_run(label: str, fen: str, nodes: int, seconds: float) -> None:
+        Instrumentation.runs.append({'label': label, 'fen': fen, 'nodes': nodes, 'seconds': round(seconds, 6),
+                                     'nps': int(nodes / seconds) if seconds else 0})
+
+    @staticmethod
+    def report() -> dict:
+        """
+        Counts of every wrapped function that was called, slowest first, and the timed runs.
+        Functions get calls per second of their own time, runs their nodes per second.
+        """
+        functions = []
+        for name, (calls, cumulative, own) in Instrumentation.stats.items():
+            if not calls: continue
+            functions.append({'name': name, 'calls': calls, 'cumulative_seconds': round(cumulative, 6),
+                              'own_seconds': round(own, 6), 'per_call_us': round(own / calls * 1e6, 3),
+                              'calls_per_second': int(calls / own) if own else 0})
+        functions.sort(key=lambda function: -function['own_seconds'])
+        return {'enabled': Instrumentation.enabled, 'runs': list(Instrumentation.runs), 'functions': functions}
+
+    @staticmethod
+    def collapsed_stacks() -> str:
+        # flamegraph.pl / speedscope input, a line per stack with its own time in microseconds
+        return "".join(f"{stack} {int(seconds * 1e6)}\n" for stack, seconds in sorted(Instrumentation.collapsed.items())
+                       if seconds >= 1e-6)
+
+
+class SamplingProfiler:
+    # samples the Python stack of a thread at a fixed interval from a background thread, the time spent in each
+    # stack is its share of the samples. Use as a context manager around the code to profile.
+    # The sampler needs the GIL to run, so samples come at most every sys.getswitchinterval() while the
+    # profiled thread is busy in Python code.
+    def __init__(self, interval: float = 0.001, thread_id: int | None = None):
+        """
+        :param interval: Seconds between samples.
+        :param thread_id: Thread to sample, defaults to the one creating the profiler.
+        """
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples: dict[str, int] = {} # stack, root first and joined by ; -> samples
+        self.running = threading.Event()
+        self.thread = None
+        self.started = 0.0
+        self.elapsed = 0.0 # seconds sampled, over every start-stop
+
+    @staticmethod
+    def frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self.running.set()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.running.clear()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+            self.elapsed += time.perf_counter() - self.started
+
+    def sample(self) -> None:
+        while self.running.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(SamplingProfiler.frame_name(frame))
+                frame = frame.f_back
+            if names:
+                stack = ";".join(reversed(names))
+                self.samples[stack] = self.samples.get(stack, 0) + 1
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def report(self) -> dict:
+        # own samples of every function, the leaf of a stack is where the time was spent
+        own = {}
+        for stack, count in self.samples.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            own[leaf] = own.get(leaf, 0) + count
+        total = sum(self.samples.values())
+        functions = [{'name': name, 'samples': count, 'share': round(count / total, 4),
+                      'own_seconds': round(self.elapsed * count / total, 6)}
+                     for name, count in sorted(own.items(), key=lambda item: -item[1])]
+        return {'interval': self.interval, 'samples': total, 'seconds': round(self.elapsed, 6), 'functions': functions}
+
+    def collapsed_stacks(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.samples.items()))
+
+
+def cprofile_report(profiler: cProfile.Profile, limit: int | None = None) -> dict:
+    """
+    cProfile results as a dict, slowest own time first.
+    :param profiler: Profile after the code ran under it.
+    :param limit: Keep only this many functions, None for all.
+    """
+    functions = []
+    for (filename, line, name), (primitive, calls, own, cumulative, _) in pstats.Stats(profiler).stats.items():
+        functions.append({'name': f"{name} ({os.path.basename(filename)}:{line})", 'calls': calls,
+                          'primitive_calls': primitive, 'own_seconds': round(own, 6),
+                          'cumulative_seconds': round(cumulative, 6)})
+    functions.sort(key=lambda function: -function['own_seconds'])
+    return {'functions': functions[:limit]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profiles a perft or a search, prints a JSON report.")
+    parser.add_argument('fen', nargs='?', default=None, help="position, the starting one by default")
+    parser.add_argument('--depth', type=int, default=4, help="perft depth or search depth")
+    parser.add_argument('--search', action='store_true', help="search instead of perft")
+    parser.add_argument('--mode', choices=('instrument', 'cprofile', 'sample'), default='instrument')
+    parser.add_argument('--interval', type=float, default=0.001, help="seconds between samples in sample mode")
+    parser.add_argument('--json', default=None, help="write the report here instead of stdout")
+    parser.add_argument('--collapsed', default=None, help="write collapsed stacks here, instrument and sample modes")
+    args = parser.parse_args()
+
+    board = Board(args.fen) if args.fen else Board()
+    run = (lambda: Instrumentation.run_search(board, args.depth)) if args.search \
+        else (lambda: Instrumentation.run_perft(board, args.depth))
+    collapsed = None
+    match args.mode:
+        case 'instrument':
+            Instrumentation.enable()
+            run()
+            Instrumentation.disable()
+            report = Instrumentation.report()
+            collapsed = Instrumentation.collapsed_stacks()
+        case 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            run()
+            profiler.disable()
+            report = cprofile_report(profiler, 50) | {'runs': Instrumentation.runs}
+        case 'sample':
+            with SamplingProfiler(args.interval) as sampler:
+                run()
+            report = sampler.report() | {'runs': Instrumentation.runs}
+            collapsed = sampler.collapsed_stacks()
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.collapsed and collapsed is not None:
+        with open(args.collapsed, 'w') as file:
+            file.write(collapsed)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import os
+import sys
+import time
+from game import PARALLEL_CONTEXT, Board, PerftCache, PieceMoves
+
+DEFAULT_EPD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "perft.epd")
+
+
+class PerftSuite:
+    # perft of a corpus of positions with known node counts, every (position, depth) is a task for a process pool.
+    # Positions come from an EPD file, one per line: fen ;D1 <nodes> ;D2 <nodes> ... ;id "<name>"
+
+    @staticmethod
+    def parse_epd(path: str) -> list[dict]:
+        """
+        Positions of an EPD file, blank lines and lines starting with # are skipped.
+        :param path: EPD file.
+        :return: Dicts with id, fen and depths, expected nodes per depth.
+        """
+        positions = []
+        with open(path) as file:
+            for number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line or line.startswith('#'): continue
+                fields = [field.strip() for field in line.split(';')]
+                fen = fields[0]
+                if len(fen.split()) == 4:
+                    fen += " 0 1" # EPD positions leave out the move counters
+                position = {'id': f"line {number}", 'fen': fen, 'depths': {}}
+                for field in fields[1:]:
+                    opcode, _, operand = field.partition(' ')
+                    if opcode == 'id':
+                        position['id'] = operand.strip().strip('"')
+                    elif opcode[:1] == 'D' and opcode[1:].isdigit():
+                        position['depths'][int(opcode[1:])] = int(operand)
+                positions.append(position)
+        return positions
+
+    @staticmethod
+    def run(positions: list[dict], max_depth: int | None = None, workers: int | None = None, cache_mb: float = 0) -> dict:
+        """
+        Perft of every position at each of its depths, in parallel.
+        :param positions: As returned by parse_epd.
+        :param max_depth: Deeper counts are skipped, None runs them all.
+        :param workers: Amount of processes, defaults to the cpu count.
+        :param cache_mb: Size of the PerftCache used by each task, 0 for none. Leave it at 0 to measure
+        move generation speed.
+        :return: Report with a result per position and depth, and whether all of them passed.
+        """
+        tasks = [(i, depth, expected) for i, position in enumerate(positions)
+                 for depth, expected in sorted(position['depths'].items())
+                 if max_depth is None or depth <= max_depth]
+        # biggest trees first, so the last ones to finish are short
+        tasks.sort(key=lambda task: -task[2])
+        results = [[] for _ in positions]
+        start = time.perf_counter()
+        # not forked, the caller may have other threads running (a UCI loop, reference engine clients)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=PARALLEL_CONTEXT) as pool:
+            futures = {pool.submit(_suite_task, positions[i]['fen'], depth, cache_mb): (i, depth, expected)
+                       for i, depth, expected in tasks}
+            for future in as_completed(futures):
+                i, depth, expected = futures[future]
+                nodes, seconds = future.result()
+                results[i].append({'depth': depth, 'expected': expected, 'nodes': nodes, 'passed': nodes == expected,
+                                   'seconds': round(seconds, 4), 'nps': int(nodes / seconds) if seconds else 0})
+        elapsed = time.perf_counter() - start
+
+        report_positions = []
+        for position, depths in zip(positions, results):
+            if not depths: continue
+            depths.sort(key=lambda result: result['depth'])
+            nodes = sum(result['nodes'] for result in depths)
+            seconds = sum(result['seconds'] for result in depths)
+            report_positions.append({'id': position['id'], 'fen': position['fen'],
+                                     'passed': all(result['passed'] for result in depths),
+                                     'nodes': nodes, 'seconds': round(seconds, 4),
+                                     'nps': int(nodes / seconds) if seconds else 0, 'depths': depths})
+        nodes = sum(position['nodes'] for position in report_positions)
+        seconds = sum(position['seconds'] for position in report_positions)
+        return {'passed': all(position['passed'] for position in report_positions),
+                'failed': [position['id'] for position in report_positions if not position['passed']],
+                'nodes': nodes, 'seconds': round(seconds, 4), 'nps': int(nodes / seconds) if seconds else 0,
+                'wall_seconds': round(elapsed, 4), 'workers': workers or os.cpu_count(), 'cache_mb': cache_mb,
+                'positions': report_positions}
+
+
+def _suite_task(fen: str, depth: int, cache_mb: float) -> tuple[int, float]:
+    # nodes and time of a single perft, the cache is new every task so timings don't depend on what ran before
+    board = Board(fen)
+    cache = PerftCache(cache_mb) if cache_mb else None
+    start = time.perf_counter()
+    nodes = PieceMoves.perft(board, depth, recursive=True, cache=cache)
+    return nodes, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the perft suite and prints a JSON report.")
+    parser.add_argument('epd', nargs='?', default=DEFAULT_EPD, help="EPD file with the expected node counts")
+    parser.add_argument('--max-depth', type=int, default=None, help="skip deeper counts")
+    parser.add_argument('--workers', type=int, default=None, help="processes, defaults to the cpu count")
+    parser.add_argument('--cache-mb', type=float, default=0, help="perft cache per task, 0 for none")
+    parser.add_argument('--output', default=None, help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    report = PerftSuite.run(PerftSuite.parse_epd(args.epd), args.max_depth, args.workers, args.cache_mb)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    sys.exit(0 if report['passed'] else 1)
@@ -0,0 +1,686 @@
+from __future__ import annotations
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from operator import countOf
+import os
+import sys
+import time
+from bitbases import Bitbases
+from game import PARALLEL_CONTEXT, Board, Evaluation, Game, Move
+from polyglot import PolyglotBook
+
+
+class SearchResult:
+    def __init__(self, best_move: Move | None, score: int, depth: int, nodes: int, elapsed: float, pv: list[Move]):
+        self.best_move = best_move
+        self.score = score # centipawns from the side to move point of view, see Search.mate_in for mate scores
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.pv = pv
+
+    def nps(self) -> int:
+        return int(self.nodes / self.elapsed) if self.elapsed > 0 else 0
+
+
+class TranspositionTable:
+    # fixed memory hash table of searched positions, every slot is two 64 bit words in flat arrays:
+    # the packed entry data and the zobrist key xored with it, so a slot torn by a concurrent writer fails the key check
+    # slots are grouped in buckets of two like PerftCache: a depth preferred slot, unless its entry is from an older
+    # search, and an always replace one
+    # the words can live in shared memory instead, one table for every process of a parallel search, no locks needed
+    BUCKET_SIZE = 2
+    _BYTES_PER_SLOT = 8 + 8 # key ^ data, data
+
+    # bound of the stored score, 0 marks an empty slot
+    EXACT = 1
+    LOWER = 2 # fail high, real score is at least this
+    UPPER = 3 # fail low, real score is at most this
+
+    # data word layout, move code is 24 bits (see Move.encode)
+    _SCORE_SHIFT = 24
+    _SCORE_OFFSET = 1 << 23 # scores are signed, stored biased
+    _DEPTH_SHIFT = 48
+    _BOUND_SHIFT = 56
+    _AGE_SHIFT = 58
+    AGE_MASK = 0b111111
+
+    def __init__(self, size_mb: float = 16, shared_memory: SharedMemory | None = None):
+        self.size_mb = size_mb # processes attaching to a shared table need the same size
+        slots = max(self.BUCKET_SIZE, int(size_mb * 1024 * 1024) // TranspositionTable._BYTES_PER_SLOT)
+        # power of two amount of buckets, so a bucket is found by masking the key
+        self.bucket_mask = (1 << ((slots // self.BUCKET_SIZE).bit_length() - 1)) - 1
+        self.size = (self.bucket_mask + 1) * self.BUCKET_SIZE
+        self.shared_memory = shared_memory
+        if shared_memory is None:
+            self.keys = array('Q', bytes(8 * self.size))
+            self.data = array('Q', bytes(8 * self.size))
+        else:
+            # same layout as the arrays, all the keys then all the data
+            self._words = shared_memory.buf[:TranspositionTable._BYTES_PER_SLOT * self.size].cast('Q')
+            self.keys = self._words[:self.size]
+            self.data = self._words[self.size:]
+        self.age = 0
+        self.reset_stats()
+
+    @staticmethod
+    def shared(size_mb: float = 16, name: str | None = None) -> TranspositionTable:
+        """
+        Table kept in a shared memory block, so several processes can search with it at once.
+        :param size_mb: Size of the table, has to be the same in every process using it.
+        :param name: Name of the block to attach to, a new block is created when None.
+        :return: The table, close it when done, the creator unlinking the block.
+        """
+        if name is None:
+            slots = max(TranspositionTable.BUCKET_SIZE, int(size_mb * 1024 * 1024) // TranspositionTable._BYTES_PER_SLOT)
+            shared_memory = SharedMemory(create=True, size=slots * TranspositionTable._BYTES_PER_SLOT)
+        elif sys.version_info >= (3, 13):
+            # the creator owns the block, attached processes mustn't have it removed when they exit
+            shared_memory = SharedMemory(name, track=False)
+        else:
+            shared_memory = SharedMemory(name)
+        return TranspositionTable(size_mb, shared_memory)
+
+    def close(self, unlink: bool = False) -> None:
+        # shared tables only, the views into the block have to go before it can be closed
+        if self.shared_memory is None: return
+        self.keys.release()
+        self.data.release()
+        self._words.release()
+        self.shared_memory.close()
+        if unlink:
+            self.shared_memory.unlink()
+        self.shared_memory = None
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def clear(self) -> None:
+        if self.shared_memory is None:
+            self.keys = array('Q', bytes(8 * self.size))
+            self.data = array('Q', bytes(8 * self.size))
+        else:
+            # cleared in place, other processes keep seeing the same block
+            self.shared_memory.buf[:TranspositionTable._BYTES_PER_SLOT * self.size] = bytes(TranspositionTable._BYTES_PER_SLOT * self.size)
+        self.age = 0
+        self.reset_stats()
+
+    def new_search(self) -> None:
+        # entries of previous searches stay usable but lose their depth preference, so the table never fills up with them
+        self.age = (self.age + 1) & TranspositionTable.AGE_MASK
+
+    def probe(self, key: int) -> tuple[int, int, int, int] | None:
+        """
+        :param key: Zobrist hash of the position.
+        :return: (move code, score, depth, bound) of the stored entry, None if the position isn't stored.
+        """
+        slot = (key & self.bucket_mask) * self.BUCKET_SIZE
+        for i in range(slot, slot + self.BUCKET_SIZE):
+            data = self.data[i]
+            if data and self.keys[i] ^ data == key:
+                self.hits += 1
+                return (data & 0xFFFFFF,
+                        (data >> TranspositionTable._SCORE_SHIFT & 0xFFFFFF) - TranspositionTable._SCORE_OFFSET,
+                        data >> TranspositionTable._DEPTH_SHIFT & 0xFF,
+                        data >> TranspositionTable._BOUND_SHIFT & 0b11)
+        self.misses += 1
+        return None
+
+    def store(self, key: int, move: int, score: int, depth: int, bound: int) -> None:
+        slot = (key & self.bucket_mask) * self.BUCKET_SIZE
+        stored = self.data[slot]
+        if (stored and self.keys[slot] ^ stored != key
+                and stored >> TranspositionTable._AGE_SHIFT == self.age
+                and depth < (stored >> TranspositionTable._DEPTH_SHIFT & 0xFF)):
+            # depth preferred slot holds a deeper search of another position from this search, use the always replace one
+            slot += 1
+            stored = self.data[slot]
+        if stored and self.keys[slot] ^ stored != key:
+            self.replacements += 1
+        data = (move
+                | (score + TranspositionTable._SCORE_OFFSET) << TranspositionTable._SCORE_SHIFT
+                | min(depth, 0xFF) << TranspositionTable._DEPTH_SHIFT
+                | bound << TranspositionTable._BOUND_SHIFT
+                | self.age << TranspositionTable._AGE_SHIFT)
+        self.data[slot] = data
+        self.keys[slot] = key ^ data
+        self.stores += 1
+
+    def hashfull(self) -> int:
+        # permille of the first 1000 slots used by the current search, like UCI reports it
+        sample = min(1000, self.size)
+        used = sum(1 for i in range(sample) if self.data[i] and self.data[i] >> TranspositionTable._AGE_SHIFT == self.age)
+        return used * 1000 // sample
+
+    def stats(self) -> dict[str, int | float]:
+        probes = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / probes if probes else 0.0,
+                'stores': self.stores, 'replacements': self.replacements,
+                'filled': self.size - countOf(self.data, 0), 'size': self.size}
+
+
+class MoveOrdering:
+    # sorts move codes so the ones most likely to cause a cutoff are searched first:
+    # hash move, captures by most valuable victim / least valuable attacker, killers, then quiet moves by history
+    MAX_PLY = 128
+    HASH_MOVE = 1 << 30
+    CAPTURE = 1 << 28 # winning and losing captures alike, still cheaper to refute than quiet moves
+    PROMOTION = 1 << 28 # by promotion piece, queen promotions are searched together with the best captures
+    KILLER = 1 << 27 # first killer one point above the second
+    HISTORY_LIMIT = 1 << 26 # history scores are halved past this, so they stay below the killers
+
+    VICTIM_VALUES = [1, 3, 3, 5, 9, 0] # indexed by engine type
+    PROMOTION_VALUES = [3, 3, 5, 9] # knight, bishop, rook, queen
+
+    def __init__(self):
+        # two quiet moves per ply that caused a cutoff in a sibling node
+        self.killers = [[0, 0] for _ in range(MoveOrdering.MAX_PLY)]
+        # cutoffs by quiet moves, indexed by engine piece and end square, depth weighted
+        self.history = [[0] * 64 for _ in range(14)]
+
+    def new_search(self) -> None:
+        self.killers = [[0, 0] for _ in range(MoveOrdering.MAX_PLY)]
+        # old history still says something about the position, but the new search should be able to outweigh it
+        for piece_history in self.history:
+            for i in range(64):
+                piece_history[i] >>= 1
+
+    def score(self, move: int, hash_move: int, ply: int) -> int:
+        if move == hash_move:
+            return MoveOrdering.HASH_MOVE
+        flags = move >> 12
+        score = 0
+        if flags & Move.CAPTURE:
+            # MVV-LVA, the victim dominates, the attacker only breaks ties
+            score = MoveOrdering.CAPTURE + MoveOrdering.VICTIM_VALUES[move >> 20 & 7] * 16 - (move >> 16 & 7)
+        kind = flags & 7
+        if kind >= Move.PROMOTION:
+            score += MoveOrdering.PROMOTION + MoveOrdering.PROMOTION_VALUES[kind - Move.PROMOTION] * 16
+        if score:
+            return score
+        killers = self.killers[ply] if ply < MoveOrdering.MAX_PLY else (0, 0)
+        if move == killers[0]:
+            return MoveOrdering.KILLER + 1
+        if move == killers[1]:
+            return MoveOrdering.KILLER
+        return self.history[move >> 16 & 15][move >> 6 & 63]
+
+    def order(self, moves: list[int], hash_move: int = 0, ply: int = 0) -> list[int]:
+        moves.sort(key=lambda move: self.score(move, hash_move, ply), reverse=True)
+        return moves
+
+    def pick(self, board: Board, hash_move: int = 0, ply: int = 0):
+        """
+        Yields the legal moves of the position best first, generating them in stages: hash move, captures and promotions,
+        killers, then quiet moves. A node cutting off early never generates the later stages.
+        The board has to be back in the same position every time the next move is asked for.
+        :param board: Position to pick moves from.
+        :param hash_move: Move stored in the transposition table for the position, 0 if none.
+        :param ply: Distance from the root, selects the killers.
+        """
+        # hash move may come from another position with the same key, only the moves of its piece are generated to check it
+        if hash_move and hash_move in board.generate_legal_move_codes(sources=1 << (hash_move & 63)):
+            yield hash_move
+        else:
+            hash_move = 0
+
+        tactical = board.generate_legal_move_codes(Board.TACTICAL_MOVES)
+        tactical.sort(key=lambda move: self.score(move, 0, ply), reverse=True)
+        for move in tactical:
+            if move != hash_move:
+                yield move
+
+        killers = self.killers[ply] if ply < MoveOrdering.MAX_PLY else ()
+        searched_killers = []
+        for killer in killers:
+            if (killer and killer != hash_move
+                    and killer in board.generate_legal_move_codes(Board.QUIET_MOVES, 1 << (killer & 63))):
+                searched_killers.append(killer)
+                yield killer
+
+        quiet = board.generate_legal_move_codes(Board.QUIET_MOVES)
+        history = self.history
+        quiet.sort(key=lambda move: history[move >> 16 & 15][move >> 6 & 63], reverse=True)
+        for move in quiet:
+            if move != hash_move and move not in searched_killers:
+                yield move
+
+    def cutoff(self, move: int, depth: int, ply: int) -> None:
+        # only quiet moves are remembered, captures and promotions are already searched early
+        if move >> 12 & Move.CAPTURE or move >> 12 & 7 >= Move.PROMOTION:
+            return
+        if ply < MoveOrdering.MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        piece_history = self.history[move >> 16 & 15]
+        end = move >> 6 & 63
+        piece_history[end] += depth * depth
+        if piece_history[end] > MoveOrdering.HISTORY_LIMIT:
+            for history in self.history:
+                for i in range(64):
+                    history[i] >>= 1
+
+
+class Search:
+    MATE = 100000 # mate found at ply n scores MATE-n
+    INFINITY = 1000000
+    CHECK_EVERY = 1024 # nodes between time/node limit checks, keeps the stop latency bounded
+    DELTA_MARGIN = 200 # positional swing a capture can bring on top of the material it wins
+    KNOWN_WIN = 20000 # added to bitbase wins, below mate scores so the search still prefers a mate it can see
+
+    def __init__(self, board: Board, tt: TranspositionTable | None = None, stop_event=None):
+        self.board = board
+        self.tt = tt if tt is not None else TranspositionTable()
+        # multiprocessing Event set by another process to stop this search, see parallel_search
+        self.stop_event = stop_event
+        self.ordering = MoveOrdering()
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = None
+        self.node_limit = None
+
+    def stop(self) -> None:
+        # safe to call from another thread, the search unwinds on its next node
+        self.stopped = True
+
+    def check_limits(self) -> None:
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.stopped = True
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            self.stopped = True
+        if self.stop_event is not None and self.stop_event.is_set():
+            self.stopped = True
+
+    def evaluate(self) -> int:
+        # incrementally kept by the board, see Board.evaluate
+        # known endgames are won or drawn by the bitbases, the evaluation is kept on wins so the search makes progress
+        board = self.board
+        score = board.evaluate()
+        result = Bitbases.probe(board)
+        if result is None:
+            return score
+        if result == Bitbases.DRAW:
+            return 0
+        if not board.bitboards[Game.WHITE | Game.PAWN] | board.bitboards[Game.BLACK | Game.PAWN]:
+            score += Search.mop_up(board) * result # rook or queen, the lone king has to be driven to a corner
+        return score + Search.KNOWN_WIN * result
+
+    @staticmethod
+    def mop_up(board: Board) -> int:
+        # bonus for the winning side, lone king far from the centre and kings close to each other,
+        # from the side to move point of view of a won position
+        own_king = board.bitboards[board.side_to_move | Game.KING].bit_length() - 1
+        enemy_king = board.bitboards[(Game.WHITE - board.side_to_move) | Game.KING].bit_length() - 1
+        lone_king, winning_king = (enemy_king, own_king) if board.occupancy[board.side_to_move >> 3].bit_count() == 2 else (own_king, enemy_king)
+        file, row = lone_king & 7, lone_king >> 3
+        centre_distance = max(3 - file, file - 4) + max(3 - row, row - 4)
+        kings_distance = max(abs(file - (winning_king & 7)), abs(row - (winning_king >> 3)))
+        return 10 * centre_distance + 4 * (7 - kings_distance)
+
+    def negamax(self, depth: int, alpha: int, beta: int, ply: int, pv: list[int]) -> int:
+        """
+        Fail-soft alpha-beta in negamax form.
+        :param depth: Remaining depth.
+        :param alpha: Lower bound, score the side to move is already guaranteed.
+        :param beta: Upper bound, score the opponent already guaranteed.
+        :param ply: Distance from the root, used for mate scores.
+        :param pv: Filled with the principal variation from this node when a move raises alpha.
+        :return: Score of the node from the side to move point of view.
+        """
+        board = self.board
+        if ply > 0 and (board.is_repetition() or (board.hm_since_irreversible or 0) >= 100):
+            return 0 # draw by repetition or fifty move rule
+        if ply > 0 and not board.hm_since_irreversible and Bitbases.probe(board) is not None:
+            return self.evaluate() # capture or promotion just went into a known endgame, no need to search it
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+
+        self.nodes += 1
+        if self.nodes % Search.CHECK_EVERY == 0:
+            self.check_limits()
+        if self.stopped:
+            return 0
+
+        hash_move = 0
+        entry = self.tt.probe(board.hash)
+        if entry is not None:
+            hash_move, tt_score, tt_depth, bound = entry
+            if tt_depth >= depth:
+                # already searched at least this deep, cut off if the stored bound is good enough
+                tt_score = Search.score_from_tt(tt_score, ply)
+                if (bound == TranspositionTable.EXACT or (bound == TranspositionTable.LOWER and tt_score >= beta)
+                        or (bound == TranspositionTable.UPPER and tt_score <= alpha)):
+                    return tt_score
+
+        original_alpha = alpha
+        best = -Search.INFINITY
+        best_move = 0
+        child_pv = []
+        for move in self.ordering.pick(board, hash_move, ply):
+            board.make_move(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1, child_pv)
+            board.unmake_move()
+            if self.stopped:
+                return 0
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    pv[:] = [move] + child_pv
+                    if alpha >= beta:
+                        self.ordering.cutoff(move, depth, ply)
+                        break # opponent won't allow this line
+            child_pv.clear()
+        if best_move == 0:
+            # no legal moves, checkmate or stalemate
+            return -Search.MATE + ply if board.in_check() else 0
+
+        if best >= beta:
+            bound = TranspositionTable.LOWER
+        elif best > original_alpha:
+            bound = TranspositionTable.EXACT
+        else:
+            bound = TranspositionTable.UPPER
+        self.tt.store(board.hash, best_move, Search.score_to_tt(best, ply), depth, bound)
+        return best
+
+    def quiescence(self, alpha: int, beta: int, ply: int) -> int:
+        """
+        Searches only captures and promotions past the horizon until the position is quiet,
+        so a leaf isn't evaluated in the middle of an exchange.
+        :param alpha: Lower bound, score the side to move is already guaranteed.
+        :param beta: Upper bound, score the opponent already guaranteed.
+        :param ply: Distance from the root, used for mate scores.
+        :return: Score of the node from the side to move point of view.
+        """
+        self.nodes += 1
+        if self.nodes % Search.CHECK_EVERY == 0:
+            self.check_limits()
+        if self.stopped:
+            return 0
+
+        board = self.board
+        if ply >= MoveOrdering.MAX_PLY:
+            return self.evaluate()
+        in_check = board.in_check()
+        if in_check:
+            # no standing pat in check, every evasion is searched, mated if there is none
+            stand_pat = best = -Search.MATE + ply
+            moves = board.generate_legal_move_codes()
+        else:
+            # side to move can usually do at least as well as the static evaluation by not capturing
+            stand_pat = best = self.evaluate()
+            if best >= beta:
+                return best
+            if best + Evaluation.MG_VALUES[Game.QUEEN] + Search.DELTA_MARGIN < alpha:
+                return best # not even winning a queen would be enough
+            alpha = max(alpha, best)
+            moves = board.generate_legal_move_codes(Board.TACTICAL_MOVES)
+
+        for move in self.ordering.order(moves, 0, ply):
+            if (not in_check and move >> 12 & 7 < Move.PROMOTION
+                    and stand_pat + Evaluation.MG_VALUES[move >> 20 & 7] + Search.DELTA_MARGIN <= alpha):
+                continue # delta pruning, the captured piece can't bring the score back up to alpha
+            board.make_move(move)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            board.unmake_move()
+            if self.stopped:
+                return 0
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best
+
+    def search_root(self, depth: int, previous_pv: list[int]) -> tuple[int, list[int]]:
+        board = self.board
+        # best move of the last iteration first, so an interrupted iteration still has it searched
+        moves = self.ordering.order(board.generate_legal_move_codes(), previous_pv[0] if previous_pv else 0)
+        alpha = -Search.INFINITY
+        pv = []
+        child_pv = []
+        for move in moves:
+            board.make_move(move)
+            score = -self.negamax(depth - 1, -Search.INFINITY, -alpha, 1, child_pv)
+            board.unmake_move()
+            if self.stopped:
+                break
+            if score > alpha:
+                alpha = score
+                pv = [move] + child_pv
+            child_pv.clear()
+        return alpha, pv
+
+    def iterative_deepening(self, max_depth: int = 64, time_limit: float | None = None, node_limit: int | None = None,
+                            callback=None, start_depth: int = 1) -> SearchResult:
+        """
+        Searches depth 1, 2, 3... until max_depth or a limit is reached, returning the deepest completed result.
+        :param max_depth: Deepest iteration to run.
+        :param time_limit: Seconds available for the move.
+        :param node_limit: Nodes available for the move.
+        :param callback: Called with the SearchResult of every completed iteration, for reporting.
+        :param start_depth: First iteration, helpers of a parallel search start deeper to stay ahead of the main one.
+        :return: SearchResult of the last completed iteration.
+        """
+        start = time.perf_counter()
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = start + time_limit if time_limit is not None else None
+        self.node_limit = node_limit
+        self.tt.new_search()
+        self.ordering.new_search()
+
+        legal_moves = self.board.generate_legal_moves()
+        # fallback in case not even depth 1 finishes
+        result = SearchResult(legal_moves[0] if legal_moves else None, 0, 0, 0, 0.0, legal_moves[:1])
+        if len(legal_moves) <= 1:
+            return result
+
+        pv = []
+        for depth in range(min(start_depth, max_depth), max_depth + 1):
+            # a stop that came before the iteration starts is seen right away, not after CHECK_EVERY nodes
+            self.check_limits()
+            if self.stopped: break
+            score, iteration_pv = self.search_root(depth, pv)
+            elapsed = time.perf_counter() - start
+            if self.stopped:
+                # partial iteration, trusted only if it already improved on the last best move
+                if iteration_pv and pv and iteration_pv[0] != pv[0] and score > result.score:
+                    result = SearchResult(Move(iteration_pv[0], self.board), score, depth, self.nodes, elapsed,
+                                          self.pv_moves(iteration_pv))
+                break
+            pv = iteration_pv
+            result = SearchResult(Move(pv[0], self.board), score, depth, self.nodes, elapsed, self.pv_moves(pv))
+            if callback:
+                callback(result)
+            if abs(score) >= Search.MATE - depth:
+                break # forced mate found, deeper won't change it
+            if self.deadline is not None and time.perf_counter() - start > (self.deadline - start) / 2:
+                break # next iteration would most likely not finish in time
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def pv_moves(self, pv: list[int]) -> list[Move]:
+        # Move objects need the position they are played from, so the line is replayed on a copy
+        board = self.board.copy()
+        moves = []
+        for code in pv:
+            moves.append(Move(code, board.copy()))
+            board.make_move(code)
+        return moves
+
+    @staticmethod
+    def score_to_tt(score: int, ply: int) -> int:
+        # mate scores are stored relative to the node instead of the root, so they stay right when transposed
+        if score >= Search.MATE - 1000:
+            return score + ply
+        if score <= -Search.MATE + 1000:
+            return score - ply
+        return score
+
+    @staticmethod
+    def score_from_tt(score: int, ply: int) -> int:
+        if score >= Search.MATE - 1000:
+            return score - ply
+        if score <= -Search.MATE + 1000:
+            return score + ply
+        return score
+
+    @staticmethod
+    def mate_in(score: int) -> int | None:
+        # moves to mate (negative when getting mated), None for normal scores
+        if abs(score) < Search.MATE - 1000:
+            return None
+        plies = Search.MATE - abs(score)
+        return (plies + 1) // 2 if score > 0 else -((plies + 1) // 2)
+
+
+def pick_move(board: Board, max_depth: int = 64, time_limit: float | None = None, node_limit: int | None = None,
+              book: PolyglotBook | None = None) -> Move | None:
+    """
+    Engine move for the position, searched within the given limits.
+    :param board: Position to search, restored before returning.
+    :param max_depth: Deepest iteration to run.
+    :param time_limit: Seconds available for the move.
+    :param node_limit: Nodes available for the move.
+    :param book: Opening book tried before searching.
+    :return: Best move found, None if there are no legal moves.
+    """
+    if book is not None:
+        move = book.pick(board)
+        if move: return move
+    return Search(board).iterative_deepening(max_depth, time_limit, node_limit).best_move
+
+
+class SearchPool:
+    # helper processes of parallel_search kept alive between searches, so a move doesn't pay for starting them
+    # (a new interpreter importing this module) every time. The stop event reaches the helpers when they start,
+    # events can't be sent along with tasks, so the same one is used for every search of the pool
+    def __init__(self, helpers: int, stop_event=None):
+        """
+        :param helpers: Amount of helper processes, the main search runs in the calling process.
+        :param stop_event: Event of PARALLEL_CONTEXT the helpers stop on, a new one when None.
+        """
+        self.helpers = helpers
+        self.stop_event = stop_event if stop_event is not None else PARALLEL_CONTEXT.Event()
+        self.executor = ProcessPoolExecutor(max_workers=helpers, mp_context=PARALLEL_CONTEXT,
+                                            initializer=_init_search_worker, initargs=(self.stop_event,))
+        # every process is started now instead of on the first search, each submit starts one while none is idle
+        for _ in range(helpers):
+            self.executor.submit(int)
+
+    def new_search(self) -> None:
+        # clears a stop left from the previous search, call it before the search can be stopped by someone else
+        self.stop_event.clear()
+
+    def close(self) -> None:
+        self.stop_event.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def parallel_search(board: Board, workers: int | None = None, max_depth: int = 64, time_limit: float | None = None,
+                    node_limit: int | None = None, tt_mb: float = 16, callback=None, stop_event=None,
+                    tt: TranspositionTable | None = None, pool: SearchPool | None = None) -> SearchResult:
+    """
+    Lazy SMP, the same iterative deepening search run by several processes sharing one transposition table.
+    Helpers alternate starting one ply deeper, so they fill the table ahead of the main search, which runs in this
+    process and decides when everyone stops.
+    :param board: Position to search, restored before returning.
+    :param workers: Amount of searching processes, this one included, defaults to the cpu count. Ignored with a pool.
+    :param max_depth: Deepest iteration to run.
+    :param time_limit: Seconds available for the move.
+    :param node_limit: Nodes available to every process.
+    :param tt_mb: Size of the shared transposition table, when tt isn't given.
+    :param callback: Called with the SearchResult of every iteration completed by the main search.
+    :param stop_event: Event of PARALLEL_CONTEXT that stops every process when set, so another thread can interrupt.
+    With a pool it has to be pool.stop_event, cleared by the caller with pool.new_search; when None the pool's event
+    is cleared here.
+    :param tt: Table in shared memory (TranspositionTable.shared) kept by the caller between searches,
+    a temporary one of tt_mb when None.
+    :param pool: Helpers kept by the caller between searches, temporary ones are started when None.
+    :return: Deepest result among the processes, nodes summed over all of them.
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = SearchPool(max(1, (workers or os.cpu_count() or 1) - 1), stop_event)
+    elif stop_event is None:
+        pool.new_search()
+    elif stop_event is not pool.stop_event:
+        raise ValueError("the helpers of a pool only see pool.stop_event")
+    stop_event = pool.stop_event
+    own_tt = tt is None
+    if own_tt:
+        tt = TranspositionTable.shared(tt_mb)
+    # helpers rebuild the position from its starting fen and moves, so they see the same repetitions
+    path = [entry[0] for entry in board.undo_stack]
+    for _ in path:
+        board.unmake_move()
+    fen = board.fen
+    for code in path:
+        board.make_move(code)
+    start = time.perf_counter()
+    try:
+        futures = [pool.executor.submit(_search_task, fen, path, tt.shared_memory.name, tt.size_mb, tt.age,
+                                        1 + helper % 2, max_depth, time_limit, node_limit)
+                   for helper in range(1, pool.helpers + 1)]
+        search = Search(board, tt, stop_event)
+        result = search.iterative_deepening(max_depth, time_limit, node_limit, callback)
+        stop_event.set() # main search is done, helpers unwind on their next limit check
+        nodes = result.nodes
+        for future in futures:
+            pv, score, depth, helper_nodes = future.result()
+            nodes += helper_nodes
+            if depth > result.depth and pv:
+                # helper completed a deeper iteration than the main search
+                result = SearchResult(Move(pv[0], board), score, depth, 0, 0.0, search.pv_moves(pv))
+    finally:
+        if own_pool:
+            pool.close()
+        if own_tt:
+            tt.close(unlink=True)
+    result.nodes = nodes
+    result.elapsed = time.perf_counter() - start
+    return result
+
+# per process state for parallel_search helpers
+_worker_stop_event = None
+_worker_tt = None # shared table attached by an earlier task, kept while the main process keeps using it
+
+def _init_search_worker(stop_event) -> None:
+    # events can only reach other processes when they are created, not through task arguments
+    global _worker_stop_event
+    _worker_stop_event = stop_event
+
+def _search_task(fen: str, path: list[int], tt_name: str, tt_mb: float, tt_age: int, start_depth: int, max_depth: int,
+                 time_limit: float | None, node_limit: int | None) -> tuple[list[int], int, int, int]:
+    global _worker_tt
+    if _worker_stop_event.is_set():
+        return [], 0, 0, 0 # main search already done, the helper started too late to help
+    board = Board(fen)
+    for code in path:
+        board.make_move(code)
+    if _worker_tt is None or _worker_tt.shared_memory.name != tt_name:
+        # first task, or the main process replaced its table (new Hash size)
+        if _worker_tt is not None:
+            _worker_tt.close()
+        _worker_tt = TranspositionTable.shared(tt_mb, tt_name)
+    _worker_tt.age = tt_age # new_search moves it forward the same as in the main process
+    result = Search(board, _worker_tt, _worker_stop_event).iterative_deepening(max_depth, time_limit, node_limit,
+                                                                               start_depth=start_depth)
+    return [move.code for move in result.pv], result.score, result.depth, result.nodes
@@ -1,18 +1,36 @@
-import subprocess
-import time
+import atexit
+import json
+import os
+import queue
 import re
+import shutil
+import sqlite3
+import subprocess
 import threading
-import queue
+import time
 
 MOVE_RE = re.compile(r"^([A-Za-z0-9]+):\s+(\d+)$")
 TOTAL_RE = re.compile(r"^Nodes searched:\s+(\d+)$")
 
-def start_ink() -> subprocess.Popen:
-    """Inicia Stockfish y devuelve el proceso."""
-    exe_path = r"E:\Documents\stockfish\stockfish-windows-x86-64-avx2.exe"
+PATH_ENV = "STOCKFISH_PATH"
+DEFAULT_EXE_PATH = r"E:\Documents\stockfish\stockfish-windows-x86-64-avx2.exe"
+CACHE_ENV = "STOCKFISH_CACHE"
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "oracle_cache.sqlite")
 
+def engine_command(exe_path: str | list[str] | None = None) -> list[str]:
+    """
+    Comando que lanza el motor. Por orden: el argumento, la variable de entorno STOCKFISH_PATH,
+    stockfish en el PATH o la ruta de siempre.
+    Una lista permite lanzar un script en su lugar, p. ej. [sys.executable, "motor_falso.py"].
+    """
+    if isinstance(exe_path, list):
+        return exe_path
+    return [exe_path or os.environ.get(PATH_ENV) or shutil.which("stockfish") or DEFAULT_EXE_PATH]
+
+def start_ink(exe_path: str | list[str] | None = None) -> subprocess.Popen:
+    """Inicia Stockfish y devuelve el proceso."""
     process = subprocess.Popen(
-        [exe_path],
+        engine_command(exe_path),
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
@@ -26,21 +44,32 @@ def send_command(process: subprocess.Popen, command: str) -> None:
     process.stdin.write(command + "\n")
     process.stdin.flush()
 
+# un único hilo lector por proceso, las llamadas sucesivas comparten su cola
+_output_queues: dict[int, queue.Queue] = {}
+_reader_threads: dict[int, threading.Thread] = {}
+
+def _output_queue(process: subprocess.Popen) -> queue.Queue:
+    q = _output_queues.get(process.pid)
+    if q is None:
+        q = queue.Queue()
+
+        def reader(proc, q):
+            for line in proc.stdout:
+                q.put(line)
+            q.put(None)  # EOF
+
+        thread = threading.Thread(target=reader, args=(process, q), daemon=True)
+        thread.start()
+        _output_queues[process.pid] = q
+        _reader_threads[process.pid] = thread
+    return q
+
 def send_command_and_grab_output(process: subprocess.Popen, command: str, timeout: float = 20.0) -> dict[str, int]:
     """
     Envía un comando y devuelve un dict con jugadas y 'Total'.
-    Usa un hilo lector + cola para no bloquear en readline().
+    Usa el hilo lector del proceso + cola para no bloquear en readline().
     """
-    q = queue.Queue()
-
-    def reader(proc, q):
-        for line in proc.stdout:
-            q.put(line)
-        q.put(None)  # EOF
-
-    thread = threading.Thread(target=reader, args=(process, q), daemon=True)
-    thread.start()
-
+    q = _output_queue(process)
     send_command(process, command)
 
     result = {}
@@ -72,10 +101,235 @@ def send_command_and_grab_output(process: subprocess.Popen, command: str, timeou
 
     return result
 
-def close_ink(process: subprocess.Popen) -> None:
-    """Intenta cerrar el CLI."""
+def close_ink(process: subprocess.Popen, timeout: float = 5.0) -> None:
+    """Cierra el CLI y espera a que termine, para no dejar procesos zombis ni tuberías abiertas."""
     try:
         send_command(process, "quit")
     except Exception:
         pass
-    process.terminate()
+    # primero se le deja salir por sí mismo, luego terminate y, si ni así, kill
+    for stop in (None, process.terminate, process.kill):
+        if stop is not None:
+            stop()
+        try:
+            process.wait(timeout=min(0.5, timeout) if stop is None else timeout)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+    # con el proceso terminado el hilo lector llega enseguida al final, stdout se cierra después para no quitárselo
+    # a mitad de una lectura
+    reader = _reader_threads.pop(process.pid, None)
+    if reader is not None:
+        reader.join(timeout)
+    for pipe in (process.stdin, process.stdout):
+        try:
+            pipe.close()
+        except Exception:
+            pass
+    _output_queues.pop(process.pid, None)
+
+
+class StockfishClient:
+    """
+    Proceso de Stockfish de larga duración. Un solo hilo lee su salida, y cada petición empieza con isready/readyok,
+    así que nada que quede de una petición anterior se confunde con la respuesta de la siguiente.
+    Las peticiones de varios hilos se atienden de una en una.
+    """
+    def __init__(self, exe_path: str | list[str] | None = None, timeout: float | None = 20.0):
+        self.process = start_ink(exe_path)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.lines = _output_queue(self.process)
+        self.send("uci")
+        self.wait_for("uciok")
+
+    def send(self, command: str) -> None:
+        send_command(self.process, command)
+
+    def wait_for(self, prefix: str, timeout: float | None = None) -> list[str]:
+        """Lee líneas hasta la que empieza por prefix (incluida) y las devuelve. Error si el motor se cierra o tarda demasiado."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.time() + timeout if timeout is not None else None
+        lines = []
+        while True:
+            try:
+                line = self.lines.get(timeout=max(0.0, deadline - time.time()) if deadline is not None else None)
+            except queue.Empty:
+                raise TimeoutError(f"Stockfish no respondió '{prefix}' a tiempo")
+            if line is None:
+                raise RuntimeError(f"Stockfish se cerró esperando '{prefix}'")
+            line = line.strip()
+            lines.append(line)
+            if line.startswith(prefix):
+                return lines
+
+    def sync(self) -> None:
+        """Espera a que el motor haya procesado todo lo enviado, descartando la salida pendiente."""
+        self.send("isready")
+        self.wait_for("readyok")
+
+    def perft(self, fen: str, depth: int, timeout: float | None = None) -> dict[str, int]:
+        """Divide de perft: nodos por jugada desde la posición."""
+        with self.lock:
+            self.sync()
+            self.send(f"position fen {fen}")
+            self.send(f"go perft {depth}")
+            lines = self.wait_for("Nodes searched", timeout)
+        result = {}
+        for line in lines:
+            m = MOVE_RE.match(line)
+            if m:
+                move, value = m.groups()
+                result[move] = int(value)
+        return result
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self) -> None:
+        close_ink(self.process)
+
+
+class StockfishPool:
+    """
+    Unos pocos StockfishClient reutilizados entre llamadas, para consultas concurrentes desde varios hilos.
+    Los procesos se lanzan solo cuando hacen falta, hasta size. Un cliente cuyo motor se cierra o no responde
+    a tiempo se descarta, y la siguiente petición lanza otro en su lugar.
+    """
+    def __init__(self, size: int = 2, exe_path: str | list[str] | None = None, timeout: float | None = 20.0):
+        self.size = size
+        self.exe_path = exe_path
+        self.timeout = timeout
+        self.idle = queue.Queue()
+        self.clients = []
+        self.lock = threading.Lock()
+
+    def acquire(self) -> StockfishClient:
+        while True:
+            with self.lock:
+                try:
+                    client = self.idle.get_nowait()
+                except queue.Empty:
+                    client = None
+                if client is None and len(self.clients) < self.size:
+                    client = StockfishClient(self.exe_path, self.timeout)
+                    self.clients.append(client)
+                    return client
+            if client is None:
+                client = self.idle.get()  # todos ocupados, espera a que se libere uno
+            if client is None:
+                continue  # aviso de discard, queda sitio para lanzar otro
+            if client.alive():
+                return client
+            self.discard(client)  # el motor murió mientras estaba libre
+
+    def release(self, client: StockfishClient) -> None:
+        self.idle.put(client)
+
+    def discard(self, client: StockfishClient) -> None:
+        """Cierra un cliente que ya no sirve y deja su sitio libre. El None despierta a quien espere en acquire."""
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        client.close()
+        self.idle.put(None)
+
+    def perft(self, fen: str, depth: int, timeout: float | None = None) -> dict[str, int]:
+        """Divide de perft con un cliente libre. Si el motor se cierra a mitad, se reintenta una vez con uno nuevo."""
+        for attempt in range(2):
+            client = self.acquire()
+            try:
+                result = client.perft(fen, depth, timeout)
+            except RuntimeError:
+                self.discard(client)
+                if attempt: raise
+                continue
+            except TimeoutError:
+                # puede seguir calculando, no se devuelve al pool para que no retrase otras peticiones
+                self.discard(client)
+                raise
+            self.release(client)
+            return result
+
+    def close(self) -> None:
+        with self.lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+            self.idle = queue.Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_pool(size: int = 2, exe_path: str | list[str] | None = None) -> StockfishPool:
+    """Pool compartido del módulo, creado en la primera llamada (los argumentos solo cuentan entonces) y cerrado al salir."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = StockfishPool(size, exe_path)
+            atexit.register(_default_pool.close)
+        return _default_pool
+
+
+class OracleCache:
+    """
+    Resultados de perft de referencia guardados en SQLite, por (FEN normalizado, profundidad),
+    para que las validaciones repetidas no vuelvan a consultar al motor. Se puede usar desde varios hilos y procesos.
+    """
+    def __init__(self, path: str | None = None):
+        self.path = path or os.environ.get(CACHE_ENV) or DEFAULT_CACHE_PATH
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS perft (fen TEXT, depth INTEGER, divide TEXT, "
+                                    "PRIMARY KEY (fen, depth))")
+
+    @staticmethod
+    def normalize_fen(fen: str) -> str:
+        """Solo piezas, turno, enroques y al paso: los contadores de jugadas no cambian el perft."""
+        return " ".join(fen.split()[:4])
+
+    def get(self, fen: str, depth: int) -> dict[str, int] | None:
+        with self.lock:
+            row = self.connection.execute("SELECT divide FROM perft WHERE fen = ? AND depth = ?",
+                                          (OracleCache.normalize_fen(fen), depth)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, fen: str, depth: int, divide: dict[str, int]) -> None:
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO perft VALUES (?, ?, ?)",
+                                    (OracleCache.normalize_fen(fen), depth, json.dumps(divide)))
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+_default_cache = None
+
+def get_cache() -> OracleCache:
+    """Caché compartida del módulo, en STOCKFISH_CACHE o data/oracle_cache.sqlite."""
+    global _default_cache
+    with _default_pool_lock:
+        if _default_cache is None:
+            _default_cache = OracleCache()
+            atexit.register(_default_cache.close)
+        return _default_cache
+
+def perft(fen: str, depth: int, use_cache: bool = True) -> dict[str, int]:
+    """Divide de perft con el pool compartido, sin lanzar un proceso por llamada. Lo ya calculado sale de la caché."""
+    if use_cache:
+        cached = get_cache().get(fen, depth)
+        if cached is not None:
+            return cached
+    result = get_pool().perft(fen, depth)
+    if use_cache:
+        get_cache().put(fen, depth, result)
+    return result
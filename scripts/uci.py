@@ -0,0 +1,238 @@
+from __future__ import annotations
+import multiprocessing
+import sys
+import threading
+from game import Board, Game, Square
+from polyglot import PolyglotBook
+from search import Search, SearchPool, SearchResult, TranspositionTable, parallel_search
+
+
+class UciEngine:
+    # UCI front-end for our engine, commands are read here while the search runs on its own thread,
+    # so stop, isready and quit are answered in the middle of a search
+    NAME = "PCE REDO"
+    AUTHOR = "PCE REDO authors"
+    MAX_HASH_MB = 4096
+    MOVE_OVERHEAD = 0.05 # seconds kept per move for the GUI and process communication
+    DEFAULT_MOVES_TO_GO = 30 # moves the remaining time is split in when the GUI doesn't say
+
+    def __init__(self, output=None):
+        self.output = output or sys.stdout
+        self.output_lock = threading.Lock() # info lines from the search thread and answers from this one
+        self.board = Board()
+        self.hash_mb = 16
+        self.threads = 1
+        # in shared memory, so helpers of a parallel search use it too and it is kept between moves
+        self.tt = TranspositionTable.shared(self.hash_mb)
+        self.pool = None # helper processes kept alive while Threads > 1
+        self.book = None
+        self.search = None
+        self.stop_event = None # multiprocessing stop of a parallel search
+        self.search_thread = None
+        # go infinite has to wait for stop before answering, even when the search ends on its own
+        self.stop_requested = threading.Event()
+
+    def send(self, line: str) -> None:
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self, source=None) -> None:
+        for line in source or sys.stdin:
+            if not self.handle(line):
+                break
+        self.stop()
+        self.close()
+
+    def close(self) -> None:
+        # helper processes and the shared table block outlive the engine otherwise
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+        self.tt.close(unlink=True)
+        if self.book:
+            self.book.close()
+            self.book = None
+
+    def handle(self, line: str) -> bool:
+        """
+        Runs a single command.
+        :param line: Command as sent by the GUI.
+        :return: False once quit is received.
+        """
+        tokens = line.split()
+        if not tokens: return True
+        command, arguments = tokens[0], tokens[1:]
+        match command:
+            case "uci":
+                self.send(f"id name {UciEngine.NAME}")
+                self.send(f"id author {UciEngine.AUTHOR}")
+                self.send(f"option name Hash type spin default {self.hash_mb} min 1 max {UciEngine.MAX_HASH_MB}")
+                self.send(f"option name Threads type spin default 1 min 1 max {multiprocessing.cpu_count()}")
+                self.send("option name BookFile type string default <empty>")
+                self.send("uciok")
+            case "isready":
+                self.send("readyok")
+            case "setoption":
+                self.set_option(arguments)
+            case "ucinewgame":
+                self.stop()
+                self.tt.clear()
+            case "position":
+                self.stop()
+                self.set_position(arguments)
+            case "go":
+                self.stop()
+                self.go(arguments)
+            case "stop":
+                self.stop()
+            case "quit":
+                return False
+        return True
+
+    def set_option(self, arguments: list[str]) -> None:
+        # setoption name <name> [value <value>], names may have spaces
+        if "name" not in arguments: return
+        value_at = arguments.index("value") if "value" in arguments else len(arguments)
+        name = " ".join(arguments[arguments.index("name") + 1:value_at]).lower()
+        value = " ".join(arguments[value_at + 1:])
+        match name:
+            case "hash" | "threads":
+                # spin options, malformed values are ignored and the rest clamped to the advertised range
+                try:
+                    number = int(value)
+                except ValueError:
+                    return
+                self.stop()
+                if name == "hash":
+                    self.hash_mb = min(max(1, number), UciEngine.MAX_HASH_MB)
+                    self.tt.close(unlink=True)
+                    self.tt = TranspositionTable.shared(self.hash_mb)
+                else:
+                    self.threads = min(max(1, number), multiprocessing.cpu_count())
+                    # helpers are started here instead of on go, so a move doesn't pay for their startup
+                    if self.pool and self.pool.helpers != self.threads - 1:
+                        self.pool.close()
+                        self.pool = None
+                    if self.threads > 1 and self.pool is None:
+                        self.pool = SearchPool(self.threads - 1)
+            case "bookfile":
+                if self.book:
+                    self.book.close()
+                self.book = PolyglotBook(value) if value and value != "<empty>" else None
+
+    def set_position(self, arguments: list[str]) -> None:
+        # position startpos|fen <fen> [moves <move>...], a bad fen or an illegal move leaves the old position
+        moves_at = arguments.index("moves") if "moves" in arguments else len(arguments)
+        if not arguments or arguments[0] not in ("startpos", "fen") or (arguments[0] == "fen" and moves_at == 1):
+            return
+        try:
+            board = Board(" ".join(arguments[1:moves_at])) if arguments[0] == "fen" else Board()
+            for engine_move in arguments[moves_at + 1:]:
+                board.make_move(engine_move)
+            # fens that parse can still be unplayable: a king missing or doubled, the side not to move in check
+            board.generate_legal_move_codes()
+            if any(board.bitboards[color | Game.KING].bit_count() != 1 for color in (Game.WHITE, Game.BLACK)):
+                return
+            enemy_king = board.bitboards[(Game.WHITE - board.side_to_move) | Game.KING].bit_length() - 1
+            if board.attackers_to(Square.all_squares()[enemy_king], board.side_to_move):
+                return
+        except Exception:
+            return
+        self.board = board
+
+    def go(self, arguments: list[str]) -> None:
+        limits = {}
+        infinite = False
+        i = 0
+        while i < len(arguments):
+            if arguments[i] == "infinite":
+                infinite = True
+            elif arguments[i] in ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo") and i + 1 < len(arguments):
+                try:
+                    limits[arguments[i]] = int(arguments[i + 1])
+                except ValueError:
+                    return # malformed go, no search is started
+                i += 1
+            i += 1
+
+        max_depth = limits.get("depth", 64)
+        node_limit = limits.get("nodes")
+        time_limit = None
+        if "movetime" in limits:
+            time_limit = max(0.01, limits["movetime"] / 1000 - UciEngine.MOVE_OVERHEAD)
+        elif not infinite and ("wtime" in limits or "btime" in limits):
+            white = self.board.side_to_move == Game.WHITE
+            remaining = limits.get("wtime" if white else "btime", 0) / 1000
+            increment = limits.get("winc" if white else "binc", 0) / 1000
+            moves_to_go = limits.get("movestogo", UciEngine.DEFAULT_MOVES_TO_GO)
+            # even share of the remaining time plus most of the increment, never more than half of what is left
+            time_limit = max(0.01, min(remaining / 2, remaining / moves_to_go + increment * 0.8) - UciEngine.MOVE_OVERHEAD)
+
+        self.stop_requested.clear()
+        # the search gets its own board, rebuilt with the game history so repetitions before the root are still seen
+        board = Board(self.root_fen())
+        for code in [entry[0] for entry in self.board.undo_stack]:
+            board.make_move(code)
+        # created before the thread starts, so a stop right after go always finds something to stop
+        if self.pool:
+            self.pool.new_search()
+            self.stop_event = self.pool.stop_event
+        else:
+            self.search = Search(board, self.tt)
+        self.search_thread = threading.Thread(target=self.search_and_answer,
+                                              args=(board, max_depth, time_limit, node_limit, infinite), daemon=True)
+        self.search_thread.start()
+
+    def root_fen(self) -> str:
+        # position before every move played through position ... moves
+        path = [entry[0] for entry in self.board.undo_stack]
+        for _ in path:
+            self.board.unmake_move()
+        fen = self.board.fen
+        for code in path:
+            self.board.make_move(code)
+        return fen
+
+    def search_and_answer(self, board: Board, max_depth: int, time_limit: float | None, node_limit: int | None,
+                          infinite: bool) -> None:
+        best_move = None
+        try:
+            if self.book and not infinite:
+                best_move = self.book.pick(board)
+            if best_move is None:
+                if self.search is None:
+                    result = parallel_search(board, max_depth=max_depth, time_limit=time_limit, node_limit=node_limit,
+                                             callback=self.info, stop_event=self.stop_event, tt=self.tt, pool=self.pool)
+                else:
+                    result = self.search.iterative_deepening(max_depth, time_limit, node_limit, self.info)
+                best_move = result.best_move
+        finally:
+            # the GUI waits for a bestmove after every go, even if the search failed
+            if infinite:
+                self.stop_requested.wait()
+            self.send(f"bestmove {best_move.engine_move if best_move else '0000'}")
+
+    def info(self, result: SearchResult) -> None:
+        mate = Search.mate_in(result.score)
+        score = f"mate {mate}" if mate is not None else f"cp {result.score}"
+        pv = " ".join(move.engine_move for move in result.pv)
+        self.send(f"info depth {result.depth} score {score} nodes {result.nodes} nps {result.nps()} "
+                  f"time {int(result.elapsed * 1000)} hashfull {self.tt.hashfull()} pv {pv}")
+
+    def stop(self) -> None:
+        # stops a running search and waits for its bestmove to be sent
+        if self.search_thread is None: return
+        self.stop_requested.set()
+        if self.search:
+            self.search.stop()
+        if self.stop_event:
+            self.stop_event.set()
+        self.search_thread.join()
+        self.search_thread = None
+        self.search = None
+        self.stop_event = None
+
+
+if __name__ == "__main__":
+    UciEngine().run()
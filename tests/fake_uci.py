@@ -0,0 +1,45 @@
+"""
+Stand-in for the reference engine, speaking just enough UCI for stockfish.py: uci, isready, position, go perft, quit.
+The divide it prints is made up but depends on the position and the depth, so answers can be told apart:
+a1a2 with the depth and b1b2 with the length of the fen.
+Some depths misbehave on purpose: 98 exits without answering (a crash), 99 never answers.
+"""
+import sys
+import time
+
+CRASH_DEPTH = 98
+HANG_DEPTH = 99
+DELAY = float(sys.argv[1]) if len(sys.argv) > 1 else 0.0 # seconds every go perft takes
+
+
+def main() -> None:
+    fen = "startpos"
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens: continue
+        match tokens[0]:
+            case "uci":
+                print("id name fake uci")
+                print("uciok", flush=True)
+            case "isready":
+                print("readyok", flush=True)
+            case "position":
+                fen = " ".join(tokens[2:]) if tokens[1:2] == ["fen"] else "startpos"
+            case "go" if tokens[1:2] == ["perft"]:
+                depth = int(tokens[2])
+                if depth == CRASH_DEPTH:
+                    sys.exit(1)
+                if depth == HANG_DEPTH:
+                    continue
+                time.sleep(DELAY)
+                print("info string counting")
+                print(f"a1a2: {depth}")
+                print(f"b1b2: {len(fen)}")
+                print()
+                print(f"Nodes searched: {depth + len(fen)}", flush=True)
+            case "quit":
+                break
+
+
+if __name__ == "__main__":
+    main()
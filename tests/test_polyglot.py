@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from game import Board
+from polyglot import Polyglot
+
+# test positions of the Polyglot book format specification, with the keys it gives for them
+SPEC_KEYS = [
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 0x463b96181691fc9c),
+    ("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1", 0x823c9b50fd114196),
+    ("rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 2", 0x0756b94461c50fb0),
+    ("rnbqkbnr/ppp1pppp/8/3pP3/8/8/PPPP1PPP/RNBQKBNR b KQkq - 0 2", 0x662fafb965db29d4),
+    ("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3", 0x22a48b5a8e47ff78),
+    ("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPPKPPP/RNBQ1BNR b kq - 0 3", 0x652a607ca3f242c1),
+    ("rnbq1bnr/ppp1pkpp/8/3pPp2/8/8/PPPPKPPP/RNBQ1BNR w - - 0 4", 0x00fdd303c946bdd9),
+    ("rnbqkbnr/p1pppppp/8/8/PpP4P/8/1P1PPPP1/RNBQKBNR b KQkq c3 0 3", 0x3c8123ea7b067637),
+    ("rnbqkbnr/p1pppppp/8/8/P6P/R1p5/1P1PPPP1/1NBQKBNR b Kkq - 0 4", 0x5c3f9b829b279560),
+]
+SPEC_MOVES = ["e2e4", "d7d5", "e4e5", "f7f5", "e1e2", "e8f7"] # from the start, reaching the first 7 positions
+
+
+class PolyglotKeyTest(unittest.TestCase):
+    def test_spec_keys_from_fen(self):
+        # fens keep en passant squares no pawn can capture on, like GUIs send them after every double push
+        for fen, key in SPEC_KEYS:
+            with self.subTest(fen=fen):
+                self.assertEqual(Polyglot.key(Board(fen)), key)
+
+    def test_spec_keys_from_moves(self):
+        board = Board()
+        self.assertEqual(Polyglot.key(board), SPEC_KEYS[0][1])
+        for engine_move, (_, key) in zip(SPEC_MOVES, SPEC_KEYS[1:]):
+            board.make_move(engine_move)
+            self.assertEqual(Polyglot.key(board), key, engine_move)
+
+    def test_en_passant_capture_position(self):
+        board = Board()
+        for engine_move in ["a2a4", "b7b5", "h2h4", "b5b4", "c2c4"]:
+            board.make_move(engine_move)
+        self.assertEqual(Polyglot.key(board), SPEC_KEYS[7][1])
+        board.make_move("b4c3")
+        board.make_move("a1a3")
+        self.assertEqual(Polyglot.key(board), SPEC_KEYS[8][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import threading
+import unittest
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIRECTORY, "..", "scripts"))
+
+from stockfish import StockfishClient, StockfishPool
+
+FAKE_UCI = os.path.join(TESTS_DIRECTORY, "fake_uci.py")
+FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+def fake_engine(delay: float = 0.0) -> list[str]:
+    return [sys.executable, FAKE_UCI, str(delay)]
+
+
+def expected_divide(fen: str, depth: int) -> dict[str, int]:
+    # what fake_uci.py answers
+    return {"a1a2": depth, "b1b2": len(fen)}
+
+
+class StockfishClientTest(unittest.TestCase):
+    def setUp(self):
+        self.client = StockfishClient(fake_engine(), timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_perft(self):
+        self.assertEqual(self.client.perft(FEN, 3), expected_divide(FEN, 3))
+
+    def test_isready_discards_output_of_earlier_commands(self):
+        # answer of a perft nobody read is still in the queue, the next request must not take it as its own
+        self.client.send(f"position fen {FEN}")
+        self.client.send("go perft 1")
+        self.assertEqual(self.client.perft("8/8/8/8/8/8/8/K6k w - - 0 1", 2),
+                         expected_divide("8/8/8/8/8/8/8/K6k w - - 0 1", 2))
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutError):
+            self.client.perft(FEN, 99, timeout=0.5)
+
+    def test_unexpected_eof(self):
+        with self.assertRaises(RuntimeError):
+            self.client.perft(FEN, 98)
+        self.client.process.wait(timeout=5) # stdout closes right before the process is reaped
+        self.assertFalse(self.client.alive())
+
+
+class StockfishPoolTest(unittest.TestCase):
+    def tearDown(self):
+        self.pool.close()
+
+    def test_respawns_killed_engine(self):
+        self.pool = StockfishPool(1, fake_engine(), timeout=5)
+        self.assertEqual(self.pool.perft(FEN, 2), expected_divide(FEN, 2))
+        first = self.pool.clients[0]
+        first.process.kill()
+        first.process.wait()
+        self.assertEqual(self.pool.perft(FEN, 3), expected_divide(FEN, 3))
+        self.assertEqual(len(self.pool.clients), 1)
+        self.assertIsNot(self.pool.clients[0], first)
+
+    def test_crash_during_request(self):
+        # retried once on a new engine, which crashes too, then the pool still works
+        self.pool = StockfishPool(1, fake_engine(), timeout=5)
+        with self.assertRaises(RuntimeError):
+            self.pool.perft(FEN, 98)
+        self.assertEqual(self.pool.clients, [])
+        self.assertEqual(self.pool.perft(FEN, 2), expected_divide(FEN, 2))
+
+    def test_timeout_discards_client(self):
+        self.pool = StockfishPool(1, fake_engine(), timeout=5)
+        with self.assertRaises(TimeoutError):
+            self.pool.perft(FEN, 99, timeout=0.5)
+        self.assertEqual(self.pool.clients, [])
+        self.assertEqual(self.pool.perft(FEN, 2), expected_divide(FEN, 2))
+
+    def test_concurrent_acquire_release(self):
+        self.pool = StockfishPool(2, fake_engine(delay=0.01), timeout=5)
+        errors = []
+
+        def worker(thread: int):
+            for depth in range(1, 6):
+                fen = f"{FEN[:-1]}{thread}"
+                try:
+                    result = self.pool.perft(fen, depth)
+                    if result != expected_divide(fen, depth):
+                        errors.append((fen, depth, result))
+                except Exception as error:
+                    errors.append(error)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(self.pool.clients), 2)
+        # every client went back to the pool
+        self.assertEqual(self.pool.idle.qsize(), len(self.pool.clients))
+
+
+if __name__ == "__main__":
+    unittest.main()